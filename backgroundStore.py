@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#Backgrounds are only needed as a crop of SIZE+2*BGMAXTRANSLATION, so they aren't kept as full RGBA images.
+#Every background is stored as raw RGB array (RGBA only if the file has transparency), which saves a quarter of the
+#memory. With a cache folder (PATHBACKGROUNDCACHE) the arrays are written once as .npy and loaded memory mapped:
+#the files are decoded only at the first start, and a crop only reads the rows of the window from the page cache,
+#which is shared by all worker processes.
+from PIL import Image
+import numpy as np
+import os
+
+class StoredBackground():
+    def __init__(self, pixels):
+        self.pixels = pixels    #(height, width, 3 or 4) uint8, in memory or memory mapped
+        self.size = (pixels.shape[1], pixels.shape[0])     #see renderBackends.getSize
+
+    #Returns the box (left, top, right, bottom) as RGBA array. Parts outside of the image are transparent, like PIL crop
+    def getRegion(self, box):
+        left, top, right, bottom = box
+        out = np.zeros((bottom-top, right-left, 4), dtype=np.uint8)
+        w, h = self.size
+        x0, y0, x1, y1 = max(left, 0), max(top, 0), min(right, w), min(bottom, h)
+        if(x0 < x1 and y0 < y1):
+            region = out[y0-top:y1-top, x0-left:x1-left]
+            region[:, :, :self.pixels.shape[2]] = self.pixels[y0:y1, x0:x1]
+            if(self.pixels.shape[2] == 3):
+                region[:, :, 3] = 255
+        return out
+
+def hasTransparency(img):
+    return img.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La') or 'transparency' in img.info
+
+def decodeBackground(file):
+    img = Image.open(file)
+    return np.asarray(img.convert('RGBA' if hasTransparency(img) else 'RGB'))
+
+def getCacheFile(file, cacheFolder):
+    import hashlib
+    stat = os.stat(file)
+    key = "%s|%d|%f" % (os.path.abspath(file), stat.st_size, stat.st_mtime)
+    return cacheFolder+"/"+hashlib.sha1(key.encode('utf-8')).hexdigest()+".npy"
+
+def loadBackground(file, cacheFolder=None):
+    if(cacheFolder is None):
+        return StoredBackground(decodeBackground(file))
+    cacheFile = getCacheFile(file, cacheFolder)
+    if(not os.path.exists(cacheFile)):
+        os.makedirs(cacheFolder, exist_ok=True)
+        tmpFile = cacheFile+".%d.tmp" % os.getpid()   #several processes could write the same cache file
+        with open(tmpFile, 'wb') as f:
+            np.save(f, decodeBackground(file))
+        os.replace(tmpFile, cacheFile)
+    return StoredBackground(np.load(cacheFile, mmap_mode='r'))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#Benchmark of the generation pipeline. Creates synthetic sprites and backgrounds and times every stage on its own
+#for several canvas sizes, object counts and backends. The results are written to a json file, so two commits can be
+#compared with --compare old.json
+#   python benchmark.py --sizes 64 227 512 --objects 1 5 10 --output bench.json
+from PIL import Image
+import numpy as np
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import finalImageSeries
+import renderBackends
+
+STAGES = ["load", "trajectory", "coordinates", "composite", "noise", "mask", "save"]
+
+#The benchmark always uses the same config, independent of the values in finalImageSeries
+def getBenchmarkConfig(size, objects, frames):
+    return finalImageSeries.getConfig(SIZE=[size, size], MINOBJ=objects, MAXOBJ=objects, MINFRAMES=frames, MAXFRAMES=frames,
+                                      TRANSLATIONLENGTH=(size/4., size/2.), DEFLECTIONBORDERLENGTH=size/2., KEEPMIDDLEOFIMAGEONCANVAS=False,
+                                      SAFEIMAGES=False, SAFETRAJECTORY=False, IMAGENOISE=False, GETSEGMENTATIONMASK=False,
+                                      SAVESEGMENTATIONMASK=False, GETOPTICALFLOW=False, SAVEOPTICALFLOW=False)
+
+#Random backgrounds (noise) and sprites (ellipse with random colours) for the benchmark
+def createFixtures(folder, numBackgrounds=4, numObjects=50, bgSize=(1024, 768), spriteSize=(64, 48), seed=0):
+    rng = np.random.RandomState(seed)
+    for sub in ["backgrounds", "objects"]:
+        if(not os.path.exists(folder+"/"+sub)):
+            os.makedirs(folder+"/"+sub)
+    for i in range(numBackgrounds):
+        img = rng.randint(0, 256, (bgSize[1], bgSize[0], 3)).astype(np.uint8)
+        Image.fromarray(img).save(folder+"/backgrounds/bg%d.png" % i)
+    h, w = spriteSize[1], spriteSize[0]
+    y, x = np.mgrid[0:h, 0:w]
+    inside = ((x-w/2.)/(w/2.))**2 + ((y-h/2.)/(h/2.))**2 < 1
+    for i in range(numObjects):
+        img = np.zeros((h, w, 4), dtype=np.uint8)
+        img[:, :, :3] = rng.randint(0, 256, (h, w, 3))
+        img[:, :, 3] = inside*255
+        Image.fromarray(img).save(folder+"/objects/obj%d.png" % i)
+    return folder+"/backgrounds", folder+"/objects"
+
+def timeIt(function, repeats):
+    times = []
+    for i in range(repeats):
+        random.seed(i)
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter()-start)
+    return times
+
+#Returns (unit, list of times) for one stage. Every stage is measured for one series, except noise (one frame)
+def runStage(stage, series, bgFolder, objFolder, backend, frames, objects, repeats, tmpFolder):
+    size = series.size
+    if(stage == "load"):
+        return "series", timeIt(lambda: finalImageSeries.ImageHandler(bgFolder, objFolder, series.backend, series.config), repeats)
+    if(stage == "trajectory"):
+        return "series", timeIt(lambda: series.createScene(frames, objects), repeats)
+    if(stage == "coordinates"):
+        def coordinates():
+            for i in range(objects):
+                finalImageSeries.getPossibleCoordinates([random.randint(0, size[0]), random.randint(0, size[1])], size, config=series.config)
+        return "series", timeIt(coordinates, repeats)
+    random.seed(0)
+    scene = series.createScene(frames, objects)
+    if(stage == "composite"):
+        return "series", timeIt(lambda: series.getFramesFromScene(frames, scene, objects), repeats)
+    if(stage == "mask"):
+        config = series.config
+        series.config = finalImageSeries.getConfig(config, GETSEGMENTATIONMASK=True)
+        try:
+            return "series", timeIt(lambda: series.getFramesFromScene(frames, scene, objects), repeats)
+        finally:
+            series.config = config
+    series.getFramesFromScene(frames, scene, objects)
+    if(stage == "noise"):
+        return "frame", timeIt(lambda: finalImageSeries.addImageNoise(series.output[0].copy(), size), repeats)
+    if(stage == "save"):
+        return "series", timeIt(lambda: series.saveImages(tmpFolder, "bench"), repeats)
+    raise ValueError("unknown stage: "+stage)
+
+def getMeta():
+    meta = {'time': time.strftime("%Y-%m-%d %H:%M:%S"), 'python': platform.python_version(), 'numpy': np.__version__,
+            'pillow': Image.__version__, 'machine': platform.machine(), 'processor': platform.processor()}
+    try:
+        meta['commit'] = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                                 stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        meta['commit'] = None
+    return meta
+
+def runBenchmark(sizes=(64, 227, 512), objectCounts=(1, 5, 10), backends=("pil", "numpy"), stages=STAGES, frames=9, repeats=3, fixtures=None):
+    tmpFolder = tempfile.mkdtemp(prefix="imageSeriesBenchmark")
+    results = []
+    try:
+        bgFolder, objFolder = createFixtures(tmpFolder+"/fixtures") if fixtures is None else (fixtures+"/backgrounds", fixtures+"/objects")
+        for backendName in backends:
+            backend = renderBackends.getBackend(backendName)
+            for size in sizes:
+                for objects in objectCounts:
+                    config = getBenchmarkConfig(size, objects, frames)
+                    series = finalImageSeries.ImageSeries(bgFolder, objFolder, None, frames, backend, config)
+                    for stage in stages:
+                        unit, times = runStage(stage, series, bgFolder, objFolder, backend, frames, objects, repeats, tmpFolder)
+                        results.append({'stage': stage, 'backend': backendName, 'size': size, 'objects': objects, 'frames': frames,
+                                        'unit': unit, 'times': times, 'mean': float(np.mean(times)), 'min': float(np.min(times))})
+                        print("%-12s %-8s size %4d objects %3d: %10.3f ms" % (stage, backendName, size, objects, 1000*np.min(times)))
+    finally:
+        shutil.rmtree(tmpFolder)
+    return {'meta': getMeta(), 'results': results}
+
+#Times every kernel of fastKernels against the NumPy code it replaces. The kernels are compiled before the timing
+def runKernelBenchmark(sizes=(64, 227, 512), repeats=3, spriteSize=(64, 48)):
+    import fastKernels
+    import opticalFlow
+    if(not fastKernels.AVAILABLE):
+        print("numba is not installed, no kernels to benchmark")
+        return []
+    rng = np.random.RandomState(0)
+    sprite = rng.randint(0, 256, (spriteSize[1], spriteSize[0], 4)).astype(np.uint8)
+    numpyBackend, numbaBackend = renderBackends.NumpyBackend(), renderBackends.NumbaBackend()
+    results = []
+    for size in sizes:
+        canvas = rng.randint(0, 256, (size, size, 4)).astype(np.uint8)
+        labels = np.full((size, size), -1, dtype=np.int16)
+        scale = size/float(4*spriteSize[0])     #the sprite covers about a quarter of the canvas
+        w, h = max(int(spriteSize[0]*scale), 1), max(int(spriteSize[1]*scale), 1)
+        warped = numpyBackend.transform(sprite, w, h, 30.)
+        premultiplied = numbaBackend.premultiply(warped)
+        kernels = {'warp': (lambda: numpyBackend.transform(sprite, w, h, 30.), lambda: numbaBackend.transform(sprite, w, h, 30.)),
+                   'paste': (lambda: numpyBackend.paste(canvas, warped, size//4, size//4), lambda: numbaBackend.paste(canvas, warped, size//4, size//4)),
+                   'pastePremultiplied': (lambda: numpyBackend.paste(canvas, premultiplied, size//4, size//4),
+                                          lambda: numbaBackend.paste(canvas, premultiplied, size//4, size//4)),
+                   'labels': (lambda: opticalFlow.pasteLabel(labels, warped[:, :, 3], size//4, size//4, 1),
+                              lambda: fastKernels.pasteLabel(labels, warped[:, :, 3], size//4, size//4, 1)),
+                   'noise': (lambda: finalImageSeries.addImageNoise(canvas.copy(), (size, size)),
+                             lambda: finalImageSeries.addImageNoise(canvas.copy(), (size, size), True))}
+        for name in kernels:
+            kernels[name][1]()      #compiles the kernel
+            numpyTimes, numbaTimes = timeIt(kernels[name][0], repeats), timeIt(kernels[name][1], repeats)
+            results.append({'kernel': name, 'size': size, 'numpy': min(numpyTimes), 'numba': min(numbaTimes)})
+            print("kernel %-18s size %4d: numpy %10.3f ms  numba %10.3f ms  (x%.2f)" % (name, size, 1000*min(numpyTimes),
+                  1000*min(numbaTimes), min(numpyTimes)/min(numbaTimes) if min(numbaTimes) > 0 else float('inf')))
+    return results
+
+def getResultKey(result):
+    return (result['stage'], result['backend'], result['size'], result['objects'], result['frames'])
+
+#Prints the ratio new/old of the best times for every measurement found in both files
+def compareResults(old, new):
+    oldResults = {}
+    for result in old['results']:
+        oldResults[getResultKey(result)] = result
+    for result in new['results']:
+        key = getResultKey(result)
+        if(key in oldResults):
+            ratio = result['min']/oldResults[key]['min'] if oldResults[key]['min'] > 0 else float('inf')
+            print("%-12s %-8s size %4d objects %3d: %10.3f ms -> %10.3f ms  (x%.2f)" % (key[0], key[1], key[2], key[3],
+                  1000*oldResults[key]['min'], 1000*result['min'], ratio))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the single stages of the image series generation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 227, 512])
+    parser.add_argument("--objects", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--backends", nargs="+", default=["pil", "numpy"], choices=renderBackends.BACKENDS)
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--frames", type=int, default=9)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--fixtures", default=None, help="folder with backgrounds/ and objects/ instead of synthetic images")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", default=None, help="json file of an older run")
+    parser.add_argument("--kernels", action="store_true", help="times the compiled kernels (fastKernels) against the NumPy code")
+    args = parser.parse_args()
+    data = runBenchmark(args.sizes, args.objects, args.backends, args.stages, args.frames, args.repeats, args.fixtures)
+    if(args.kernels):
+        data['kernels'] = runKernelBenchmark(args.sizes, args.repeats)
+    with open(args.output, 'w') as f:
+        json.dump(data, f, indent=1)
+    if(args.compare is not None):
+        with open(args.compare, 'r') as f:
+            compareResults(json.load(f), data)
@@ -5,6 +5,14 @@ import os
 import math
 from time import sleep
 import shutil
+import argparse
+import hashlib
+from multiprocessing import Pool
+
+LOGOFILENAME = "logo-thumbnail.png"
+MANIFESTENDING = ".manifest.json"     #the manifest is next to the output folder, the generator loads every file in it
+TMPENDING = ".tmp"      #folder next to the output folder for the images which are written, for the same reason
+PREPROCESSVERSION = 1   #increase this if processImage changes. All images are processed again
 
 ''' #das hier wird nicht mehr gebraucht.
 #Hat nur dazu gedient, die Bilder von den restlichen html etc Dateien zu trennen und an einen anderen Ort zu speichern
@@ -20,8 +28,8 @@ def deleteLogo(path):
     files=[]
     for file in os.listdir(path):
         if(os.path.isfile(path+"/"+file)): 
-            if(file=="logo-thumbnail.png"): #deletes the Image named logo-thumbnail
-                os.remove(path+"/logo-thumbnail.png") 
+            if(file==LOGOFILENAME): #deletes the Image named logo-thumbnail
+                os.remove(path+"/"+LOGOFILENAME) 
         else:            
             deleteLogo(path+"/"+file) 
                 
@@ -36,57 +44,159 @@ def getFilesFromDirectory(path, filetype):
                 files.append(f)
     return files
 
-def setAlpha(newSize=32.): #Images are currently overwritten, so take care if you want to keep them
+#Makes the (nearly) white pixels transparent. The thresholds are applied on the sum of r, g and b for the whole image at once:
+#>=760 is set to (0,0,0,0), >=755 keeps the colour with alpha 100
+def whiteToAlpha(img):
+    npImg = np.array(img.convert('RGBA'))
+    rgbSum = npImg[:, :, :3].sum(axis=2, dtype=np.int32)
+    npImg[rgbSum >= 755, 3] = 100
+    npImg[rgbSum >= 760] = 0
+    return Image.fromarray(npImg)
+
+#transparent background, crop to the bounding box and resize to newSize (keeps the ratio)
+def processImage(img, newSize=32.):
+    img = whiteToAlpha(img)
+    #Crop Image to boundingBox
+    img = img.crop(getBoundingBox(img))
+    
+    #Resize to newSize and keep ratio
+    maxPixel = max(img.size)
+    newscaleX = round(img.size[0]*newSize/maxPixel)
+    newscaleY = round(img.size[1]*newSize/maxPixel)
+    return img.resize((int(newscaleX),int(newscaleY)))
+
+def setAlpha(newSize=32.): #Images are currently overwritten, so take care if you want to keep them. Use preprocessObjects to keep them
     files = getFilesFromDirectory("BilderMitAlpha", ".png")
     counter=0
     for file in files:
         counter+=1
         print("currently at: "+str(counter/len(files))+"%")
-        img = Image.open(file)
-        img = img.convert('RGBA')
-        pixdata = img.load()
-
-        for y in range(img.size[1]):
-            for x in range(img.size[0]):
-                if pixdata[x, y][0]+pixdata[x, y][1]+pixdata[x, y][2]>=760:
-                    pixdata[x, y] = (0, 0, 0, 0)
-                elif pixdata[x, y][0]+pixdata[x, y][1]+pixdata[x, y][2]>=755:
-                    pixdata[x, y] = (pixdata[x, y][0],pixdata[x, y][1],pixdata[x, y][2],100)
-        #Crop Image to boundingBox
-        img = img.crop(getBoundingBox(img))
-        
-        #Resize to newSize and keep ratio
+        img = processImage(Image.open(file), newSize)
         print(img.size)
-        maxPixel = max(img.size)
-        newscaleX = round(img.size[0]*newSize/maxPixel)
-        newscaleY = round(img.size[1]*newSize/maxPixel)
-        img.resize((int(newscaleX),int(newscaleY))).save(file, "PNG")
+        img.save(file, "PNG")
     
 
   
+#Returns the box (left, top, right, bottom) around all pixels with alpha > 0. right and bottom are exclusive like in Image.crop
 def getBoundingBox(img):
-    npImg = np.array(img)
-    marker = [True,True,True,True]
-    boundingBox = [0, 0, img.size[0], img.size[1]]
-    for i in range(img.size[0]):
-        #print(pixdata[i,16])
-        for j in range(img.size[1]):
-            if(marker[0] and not np.array_equal(npImg[j][i],[0,0,0,0])):
-                boundingBox[0] = i
-                marker[0] = False
-            if(marker[1] and not np.array_equal(npImg[i][j],[0,0,0,0])):
-                boundingBox[1] = i
-                marker[1] = False
-            if(marker[2] and not np.array_equal(npImg[j][img.size[0]-1-i],[0,0,0,0])):
-                boundingBox[2] = img.size[0]-1-i
-                marker[2] = False                
-            if(marker[3] and not np.array_equal(npImg[img.size[1]-1-i][j],[0,0,0,0])):
-                boundingBox[3] = img.size[1]-1-i
-                marker[3] = False
-    return boundingBox
+    alpha = np.asarray(img.convert('RGBA'))[:, :, 3] > 0
+    cols = np.nonzero(alpha.any(axis=0))[0]
+    rows = np.nonzero(alpha.any(axis=1))[0]
+    if(len(cols) == 0):     #completely transparent, keep the whole image
+        return [0, 0, img.size[0], img.size[1]]
+    return [int(cols[0]), int(rows[0]), int(cols[-1])+1, int(rows[-1])+1]
 
     
    
-#deleteLogo("Sicherungen/BilderMitAlpha")    
-#setAlpha()     
-    
\ No newline at end of file
+################## Preprocessing pipeline ##################
+#Processes all images of sourceFolder into destinationFolder (same subfolders), the source images are not changed.
+#The manifest (destinationFolder+MANIFESTENDING) stores the hash of every source image and the parameters it was processed with,
+#so a rerun only processes new or changed images. Stages: filter logos -> hash -> processImage -> save
+#Images which can't be read or processed are skipped with a message, they have no output and no manifest entry.
+def isLogo(file):   #the logo thumbnails of shapenet are no objects
+    return os.path.basename(file) == LOGOFILENAME
+
+def getFileHash(file):
+    h = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def getManifestPath(destinationFolder):
+    return destinationFolder.rstrip("/\\")+MANIFESTENDING
+
+def getTmpFolder(destinationFolder):
+    return destinationFolder.rstrip("/\\")+TMPENDING
+
+def loadManifest(destinationFolder):
+    path = getManifestPath(destinationFolder)
+    if(not os.path.exists(path)):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def saveManifest(destinationFolder, manifest): #atomic, a crashed run never leaves a broken manifest
+    path = getManifestPath(destinationFolder)
+    with open(path+".tmp", 'w') as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    os.replace(path+".tmp", path)
+
+#runs in the worker processes. Returns the relative path, the manifest entry (None if the image was skipped) and if
+#the image was processed. The image is written into the tmp folder first (same file system) and then moved
+def preprocessFile(task):
+    source, destination, relPath, params, oldEntry, tmpFile = task
+    try:
+        fileHash = getFileHash(source)
+        entry = {'hash': fileHash, 'params': params}
+        if(oldEntry == entry and os.path.exists(destination)):
+            return relPath, entry, False
+        img = processImage(Image.open(source), params['newSize'])
+    except Exception as e:  #e.g. a broken or truncated file, the other images are still processed
+        print("skipped "+source+": "+str(e))
+        if(os.path.exists(destination)):    #the output of an older version of the file
+            os.remove(destination)
+        return relPath, None, False
+    folder = os.path.dirname(destination)
+    if(not os.path.exists(folder)):
+        os.makedirs(folder, exist_ok=True)  #several workers can create the same folder
+    img.save(tmpFile, "PNG")
+    os.replace(tmpFile, destination)
+    return relPath, entry, True
+
+def preprocessObjects(sourceFolder, destinationFolder, newSize=32., workers=None, saveEvery=1000):
+    params = {'newSize': newSize, 'version': PREPROCESSVERSION}
+    if(not os.path.exists(destinationFolder)):
+        os.makedirs(destinationFolder)
+    manifest = loadManifest(destinationFolder)
+    tmpFolder = getTmpFolder(destinationFolder)
+    if(not os.path.exists(tmpFolder)):
+        os.makedirs(tmpFolder)
+    for file in getFilesFromDirectory(destinationFolder, ".tmp"):   #older versions wrote them into the output folder
+        os.remove(file)
+    tasks = []
+    for file in getFilesFromDirectory(sourceFolder, ".png"):
+        if(isLogo(file)):
+            continue
+        relPath = os.path.relpath(file, sourceFolder).replace(os.sep, "/")
+        tmpFile = tmpFolder+"/"+hashlib.sha1(relPath.encode('utf-8')).hexdigest()+".png"    #one per image, no subfolders
+        tasks.append((file, destinationFolder+"/"+relPath, relPath, params, manifest.get(relPath), tmpFile))
+
+    #outputs of removed source images are deleted, so the output folder always matches the source folder
+    relPaths = set(task[2] for task in tasks)
+    for relPath in list(manifest.keys()):
+        if(relPath not in relPaths):
+            del manifest[relPath]
+            if(os.path.exists(destinationFolder+"/"+relPath)):
+                os.remove(destinationFolder+"/"+relPath)
+
+    processed, skipped, counter = 0, 0, 0
+    pool = Pool(workers)
+    try:
+        for relPath, entry, changed in pool.imap_unordered(preprocessFile, tasks, chunksize=16):
+            counter += 1
+            if(entry is None):
+                manifest.pop(relPath, None)
+                skipped += 1
+            else:
+                manifest[relPath] = entry
+                processed += changed
+            if(counter % saveEvery == 0):
+                saveManifest(destinationFolder, manifest)
+                print("currently at: "+str(100.*counter/len(tasks))+"%")
+    finally:
+        pool.close()
+        pool.join()
+        saveManifest(destinationFolder, manifest)
+        shutil.rmtree(tmpFolder, ignore_errors=True)    #also the files of a crashed run
+    print("Images processed: ", processed, "unchanged: ", counter-processed-skipped, "skipped: ", skipped)
+    return processed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Makes the background of the object images transparent, crops and resizes them")
+    parser.add_argument("source", help="folder with the original images (is not changed)")
+    parser.add_argument("destination", help="output folder")
+    parser.add_argument("--size", type=float, default=32., help="size of the longer side of the output images")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: all cpus)")
+    args = parser.parse_args()
+    preprocessObjects(args.source, args.destination, args.size, args.workers)
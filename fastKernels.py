@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#Compiled kernels for the inner loops of the generator: warping and pasting sprites (backend "numba"), the image noise
+#and the label maps of the optical flow (COMPILEDKERNELS). They are compiled with numba if it is installed, every kernel
+#works pixel by pixel without temporary arrays and gives exactly the same result as the NumPy code it replaces
+#(the noise gets other random numbers, see addNoise).
+#Without numba AVAILABLE is False and the callers use their NumPy code. The compiled kernels are cached in __pycache__,
+#so only the first start pays for the compilation. The kernels release the GIL, so they can run on RENDERTHREADS threads.
+import numpy as np
+
+try:
+    import numba
+    AVAILABLE = True
+except ImportError:
+    numba = None
+    AVAILABLE = False
+
+def jit(function):  #without numba the kernels stay plain (slow) python functions
+    if(AVAILABLE):
+        return numba.njit(cache=True, nogil=True)(function)
+    return function
+
+#Same arithmetic as NumpyBackend.paste (and PIL paste): dst = (dst*(255-a) + src*a + 128) / 255 with PIL rounding
+@jit
+def pasteStraight(canvas, img, x, y):
+    h, w = canvas.shape[0], canvas.shape[1]
+    for row in range(max(y, 0), min(y+img.shape[0], h)):
+        for col in range(max(x, 0), min(x+img.shape[1], w)):
+            alpha = np.int32(img[row-y, col-x, 3])
+            for c in range(4):
+                tmp = np.int32(canvas[row, col, c])*(255-alpha) + np.int32(img[row-y, col-x, c])*alpha + 128
+                canvas[row, col, c] = (tmp + (tmp >> 8)) >> 8
+    return canvas
+
+#blend and inverse of a PremultipliedSprite (see renderBackends)
+@jit
+def pastePremultiplied(canvas, blend, inverse, x, y):
+    h, w = canvas.shape[0], canvas.shape[1]
+    for row in range(max(y, 0), min(y+blend.shape[0], h)):
+        for col in range(max(x, 0), min(x+blend.shape[1], w)):
+            inv = np.int32(inverse[row-y, col-x, 0])
+            for c in range(4):
+                tmp = np.int32(canvas[row, col, c])*inv + np.int32(blend[row-y, col-x, c])
+                canvas[row, col, c] = (tmp + (tmp >> 8)) >> 8
+    return canvas
+
+#Bilinear warp of the padded premultiplied image (see renderBackends.getPaddedPremultiplied) with the inverse matrix,
+#unpremultiplied to uint8. Same order of the operations as sampleBilinear and unpremultiply
+@jit
+def warpBilinear(padded, matrix, nw, nh):
+    h, w = padded.shape[0]-2, padded.shape[1]-2
+    out = np.empty((nh, nw, 4), dtype=np.uint8)
+    value = np.empty(4, dtype=np.float64)
+    for row in range(nh):
+        y = np.float64(np.float32(row))
+        for col in range(nw):
+            x = np.float64(np.float32(col))
+            srcX = matrix[0, 0]*x + matrix[0, 1]*y + matrix[0, 2]
+            srcY = matrix[1, 0]*x + matrix[1, 1]*y + matrix[1, 2]
+            fx0, fy0 = np.floor(srcX), np.floor(srcY)
+            fx, fy = srcX-fx0, srcY-fy0
+            x0, y0 = np.int64(fx0)+1, np.int64(fy0)+1
+            x1, y1 = min(max(x0+1, 0), w+1), min(max(y0+1, 0), h+1)
+            x0, y0 = min(max(x0, 0), w+1), min(max(y0, 0), h+1)
+            for c in range(4):
+                value[c] = (padded[y0, x0, c]*(1-fx) + padded[y0, x1, c]*fx)*(1-fy) + (padded[y1, x0, c]*(1-fx) + padded[y1, x1, c]*fx)*fy
+            alpha = value[3]
+            for c in range(3):
+                v = value[c]*255./alpha if alpha > 0 else 0.
+                out[row, col, c] = np.uint8(min(max(v+0.5, 0.), 255.))
+            out[row, col, 3] = np.uint8(min(max(alpha+0.5, 0.), 255.))
+    return out
+
+#Same as opticalFlow.pasteLabel
+@jit
+def pasteLabel(labelMap, alpha, posX, posY, label):
+    h, w = labelMap.shape[0], labelMap.shape[1]
+    for row in range(max(posY, 0), min(posY+alpha.shape[0], h)):
+        for col in range(max(posX, 0), min(posX+alpha.shape[1], w)):
+            if(alpha[row-posY, col-posX] > 0):
+                labelMap[row, col] = label
+    return labelMap
+
+#Same as the loop of finalImageSeries.addImageNoise. draws are uniform random numbers in [0, 1), shape (width, height, 3),
+#which replace the uniform(0,2)/2 of the loop. Like there, x indexes the first axis of img
+@jit
+def addNoise(img, draws):
+    for x in range(draws.shape[0]):
+        for y in range(draws.shape[1]):
+            for i in range(3):
+                val = 1-(0.+2.*draws[x, y, i])     #1-uniform(0,2)
+                absval = abs(val)
+                sign = 1 if val >= 0 else -1
+                if(absval >= 0.56):
+                    col = 0
+                elif(absval >= 0.8):
+                    col = 1*sign
+                elif(absval >= 0.92):
+                    col = 2*sign
+                elif(absval >= 0.96):
+                    col = 3*sign
+                elif(absval >= 0.98):
+                    col = 4*sign
+                else:
+                    col = 5*sign
+                dc = np.int64(img[x, y, i])-col
+                if(dc >= 0 and dc <= 255):
+                    img[x, y, i] = dc
+    return img
@@ -3,10 +3,21 @@ from PIL import Image
 import numpy as np
 import json
 import os
+import io
 import math
+import time
+import threading
+from collections import OrderedDict, namedtuple
+import renderBackends
+import seriesStats
+import backgroundStore
+import seriesCache
+from renderBackends import getSize
 from random import randint  #randint(a,b) returns random values a <= N <= b, so be careful, because b is included
 from random import uniform
 from random import choice
+from random import getrandbits
+#opticalFlow, spriteAtlas, layeredSeries, hashlib, fastKernels and concurrent.futures are imported in the functions which need them, so a plain run doesn't pay for them
 
 ################## Config ##################
 ### Options about folders and filenames ###
@@ -34,8 +45,24 @@ MAXROTATE =  45.0   #maximum rotation angle degree (positive values turn object
 #A script is provided
 MINSCALE = 0.5      #min scale for image (it should be visible) 
 MAXSCALE = 1.0      #max scale for image (should not fill whole background)
+#Objects are resampled from the nearest larger level of a mip pyramid (each level has half the size of the previous one).
+#This is faster for small scales and gives a better quality when scaling down.
+USEPYRAMID = True
+MINPYRAMIDSIZE = 4          #the smallest level of the pyramid has at least this size on each side
+PATHPYRAMIDCACHE = None     #folder where the pyramids are cached. None builds them at every start
+#All objects (with their pyramids) are packed into a few large arrays. If PATHATLAS is set, the atlas is saved there and
+#loaded memory mapped on the next start (shared by all processes). Delete the folder if the objects change.
+USEATLAS = False
+PATHATLAS = None
+#Backgrounds are kept as RGB arrays and only the cropped window is converted (see backgroundStore). If PATHBACKGROUNDCACHE
+#is set, they are decoded once into this folder and loaded memory mapped on the next start. None decodes them at every start
+PATHBACKGROUNDCACHE = None
 
 
+#Backend for loading, cropping, transforming and compositing the images (see renderBackends): "pil", "numpy", "skimage" or "numba"
+BACKEND = "pil"
+COMPILEDKERNELS = True      #noise and label maps of the flow with the numba kernels of fastKernels, if numba is installed. Same output, except the noise draws its random numbers with numpy
+
 ################## Mode declaration ##################
 #Modes operate on the interval [0,1]. 
 #0: do nothing (turns mode off e.g. no rotation wanted)
@@ -57,29 +84,106 @@ ROTATIONMODE = [1]
 ###### Additional options and modes ######
 SAFETRAJECTORY = False
 SAFEIMAGES = True
+LAYEREDIMAGES = False           #SAFEIMAGES writes one layered container per series (background once, changed tiles per frame, see layeredSeries) instead of a png per frame
 KEEPMIDDLEOFIMAGEONCANVAS = False 
 IMAGENOISE = False   #adds a random noise to the picture. 
 MOVEABLEBACKGROUND = False       #Mode if background also moves
 GETSEGMENTATIONMASK = False     #gets the individual segmentationMask for each frame for each object
 SAVESEGMENTATIONMASK = False    #saves the segmentationMasks as picture in the folder "test"
+GETOPTICALFLOW = False          #computes the dense flow between consecutive frames (stored in imageFlow)
+SAVEOPTICALFLOW = False         #saves the flow as .flo and 16 bit png next to the images (needs GETOPTICALFLOW)
 WITHRANDOMTRAJECTORYOFFSET = False
+STATSLOGINTERVAL = None         #prints the timing of all stages every x seconds (see seriesStats). None: no output
+SPRITECACHESIZE = 32            #transformed sprites are kept, objects with constant scale and rotation are transformed once
+PREMULTIPLIEDSPRITES = False    #numpy/skimage/numba backend: transformed sprites are cached premultiplied, pasting is one multiply-add. Same output
+RENDERTHREADS = 1               #the frames of a series are rendered on this many threads (PIL and numpy release the GIL). 1: one after another
 
 ################ End Config ################
 
+#ImageHandler, ImageSeries and MoveableObject don't read the values above directly, they get a SeriesConfig.
+#getConfig() takes the current values of this module, single values can be changed with keywords, e.g.
+#getConfig(SIZE=[64,64], MAXOBJ=2) or getConfig(config, IMAGENOISE=True) to change an existing config.
+#The config can't be changed afterwards (lists become tuples), so several jobs with different configs can run at the same time.
+CONFIGNAMES = ["PATHBACKGROUNDFOLDER", "PATHOBJECTFOLDER", "PATHTOTRAJECTORYFILE", "SERIESNAME", "SERIESFOLDER",
+               "SIZE", "MINFRAMES", "MAXFRAMES", "MINOBJ", "MAXOBJ", "TRANSLATIONLENGTH", "DEFLECTIONBORDERLENGTH",
+               "BGMAXTRANSLATION", "TRAJECTORYOFFSET", "MINROTATE", "MAXROTATE", "MINSCALE", "MAXSCALE",
+               "USEPYRAMID", "MINPYRAMIDSIZE", "PATHPYRAMIDCACHE", "USEATLAS", "PATHATLAS", "PATHBACKGROUNDCACHE", "BACKEND", "COMPILEDKERNELS",
+               "TRANSLATIONMODEX", "TRANSLATIONMODEY", "SCALEMODE", "ROTATIONMODE",
+               "SAFETRAJECTORY", "SAFEIMAGES", "LAYEREDIMAGES", "KEEPMIDDLEOFIMAGEONCANVAS", "IMAGENOISE", "MOVEABLEBACKGROUND",
+               "GETSEGMENTATIONMASK", "SAVESEGMENTATIONMASK", "GETOPTICALFLOW", "SAVEOPTICALFLOW",
+               "WITHRANDOMTRAJECTORYOFFSET", "STATSLOGINTERVAL", "SPRITECACHESIZE", "PREMULTIPLIEDSPRITES", "RENDERTHREADS"]
+SeriesConfig = namedtuple("SeriesConfig", CONFIGNAMES)
+
+def getConfig(config=None, **values):
+    unknown = [name for name in values if name not in CONFIGNAMES]
+    if(len(unknown) > 0):
+        raise ValueError("unknown config values: "+", ".join(unknown))
+    base = globals() if config is None else config._asdict()
+    return SeriesConfig(**dict((name, toImmutable(values[name] if name in values else base[name])) for name in CONFIGNAMES))
+
+def toImmutable(value):
+    if(isinstance(value, list)):
+        return tuple(toImmutable(v) for v in value)
+    return value
+
 class ImageHandler():
-    def __init__(self, background, objects):    
+    def __init__(self, background, objects, backend=None, config=None):    
+        self.config = getConfig() if config is None else config
+        self.backend = renderBackends.getBackend(self.config.BACKEND) if backend is None else backend
         self.bgList = {}
         self.objList = {}
         for file in self.getFilesFromDirectory(background,''):
-            img = Image.open(file)
-            self.bgList[file] = img.convert('RGBA')
+            self.bgList[file] = self.loadBackground(file)
         print("Backgrounds loaded")
-        for file in self.getFilesFromDirectory(objects,''):
-            img = Image.open(file)
-            self.objList[file] = img.convert('RGBA')
+        self.atlas = None
+        if(self.config.USEATLAS):   #a saved atlas is rebuilt if the object files or the pyramid settings changed
+            import spriteAtlas
+            source = spriteAtlas.getSource(self.getFilesFromDirectory(objects,''), self.config.MINPYRAMIDSIZE if self.config.USEPYRAMID else None)
+        if(self.config.USEATLAS and self.config.PATHATLAS is not None and spriteAtlas.atlasExists(self.config.PATHATLAS, source)):
+            self.atlas = spriteAtlas.SpriteAtlas.load(self.config.PATHATLAS)
+        else:
+            for file in self.getFilesFromDirectory(objects,''):
+                self.objList[file] = self.loadObject(file)
         print("Objects loaded")
         self.bgKeys = list(self.bgList.keys())
-        self.objKeys = list(self.objList.keys())
+        self.objKeys = list(self.objList.keys()) if self.atlas is None else self.atlas.getKeys()
+        #backgrounds are always drawn with scale 1, so they don't need a pyramid
+        self.pyramids = {}
+        if(self.config.USEPYRAMID and self.atlas is None):
+            for key in self.objKeys:
+                self.pyramids[key] = loadPyramid(key, self.objList[key], self.config.PATHPYRAMIDCACHE, self.config.MINPYRAMIDSIZE)
+            print("Pyramids loaded")
+        if(self.config.USEATLAS and self.atlas is None):
+            sprites = {}
+            for key in self.objKeys:
+                sprites[key] = self.pyramids[key] if self.config.USEPYRAMID else [self.objList[key]]
+            self.atlas = spriteAtlas.SpriteAtlas.build(sprites, source=source)
+            if(self.config.PATHATLAS is not None):
+                self.atlas.save(self.config.PATHATLAS)
+            self.objList = {}   #the sprites are only kept in the atlas
+            self.pyramids = {}
+            print("Atlas created")
+        #everything is loaded and preprocessed with PIL, afterwards the images are converted for the backend.
+        #The backgrounds are converted when they are cropped (see getBackground)
+        for key in self.objList:
+            self.objList[key] = self.backend.fromPIL(self.objList[key])
+            if(key in self.pyramids):
+                self.pyramids[key] = [self.objList[key]]+[self.backend.fromPIL(level) for level in self.pyramids[key][1:]]
+        #the sprites of the atlas share the pixels of its pages (see fromAtlas). They are created once, so every call of
+        #getObjFromKey returns the same object (the transformed sprites are cached by id, see getTransformedSprite)
+        if(self.atlas is not None):
+            for key in self.objKeys:
+                levels = self.atlas.getLevelCount(key) if self.config.USEPYRAMID else 1
+                sprites = [self.backend.fromAtlas(self.atlas, key, level) for level in range(levels)]
+                self.objList[key] = sprites[0]
+                if(self.config.USEPYRAMID):
+                    self.pyramids[key] = sprites
+
+    def loadBackground(self, file):
+        return backgroundStore.loadBackground(file, self.config.PATHBACKGROUNDCACHE)
+
+    def loadObject(self, file):     #RGBA PIL image, the objects are preprocessed with PIL (pyramids, atlas)
+        return Image.open(file).convert('RGBA')
 
     #This can be used for creating the lists for the backgrounds and the moveable objects. 
     #It will find all subsequent files recursively
@@ -97,7 +201,7 @@ class ImageHandler():
 
     def getRandomObj(self):
         key = choice(self.objKeys)
-        return self.objList[key], key
+        return self.getObjFromKey(key), key
     
     def getRandomBg(self):
         key = choice(self.bgKeys)
@@ -108,41 +212,70 @@ class ImageHandler():
     
     def getBgFromKey(self, key):
         return self.bgList[key]     #don't raise an error here if file doesn't exist.
+
+    def getPyramidFromKey(self, key):   #returns None if USEPYRAMID is not set
+        return self.pyramids.get(key)
         
     def __str__(self):
-        print("Objects loaded: ", len(self.objList))
+        print("Objects loaded: ", len(self.objKeys))
         print("Backgrounds loaded: ", len(self.bgList))
         return ""
             
 class ImageSeries():
-    def __init__(self, background=PATHBACKGROUNDFOLDER, objects=PATHOBJECTFOLDER, size=SIZE, seriesLength=0):
-        self.images = ImageHandler(background, objects)
-        self.seriesLength = seriesLength if seriesLength > 0 else randint(MINFRAMES, MAXFRAMES)
-        self.size = size
-        self.output = np.array([None]*self.seriesLength)
-        self.segmentationLayers = np.array([None]*(self.seriesLength))
-        self.imageFlow = np.array([None]*(self.seriesLength))
+    #background, objects and size are taken from the config if they are None.
+    #An already loaded ImageHandler (images) can be shared by several series, background, objects and backend are ignored then.
+    #With a seriesCache.SeriesCache (cache) replayed scenes (getSeriesWithParam, getSeriesFromFile) are only rendered once
+    def __init__(self, background=None, objects=None, size=None, seriesLength=0, backend=None, config=None, images=None, cache=None):
+        self.config = getConfig() if config is None else config
+        if(images is None):
+            images = ImageHandler(self.config.PATHBACKGROUNDFOLDER if background is None else background,
+                                  self.config.PATHOBJECTFOLDER if objects is None else objects, backend, self.config)
+        self.images = images
+        self.backend = self.images.backend
+        self.size = self.config.SIZE if size is None else size
+        self.setSeriesLength(seriesLength if seriesLength > 0 else randint(self.config.MINFRAMES, self.config.MAXFRAMES))
         self.scene = []
+        self.stats = seriesStats.SeriesStats(self.config.STATSLOGINTERVAL)
+        self.spriteCache = OrderedDict()
+        self.spriteCacheLock = threading.Lock()    #the frames can be rendered by several threads (RENDERTHREADS)
+        self.renderPool = None
+        self.cache = cache
 
         #assertions:
-        if(KEEPMIDDLEOFIMAGEONCANVAS):
-            assert min(size)/2. > TRANSLATIONLENGTH[0], "minimum translationLength is too high. No coordinates can be matched"
+        if(self.config.KEEPMIDDLEOFIMAGEONCANVAS):
+            assert min(self.size)/2. > self.config.TRANSLATIONLENGTH[0], "minimum translationLength is too high. No coordinates can be matched"
         
+    def setSeriesLength(self, seriesLength):   #the following series have seriesLength frames
+        self.seriesLength = seriesLength
+        self.output = np.array([None]*self.seriesLength)
+        self.segmentationLayers = np.array([None]*(self.seriesLength))
+        self.imageFlow = np.array([None]*(self.seriesLength))
+
     def getSeries(self):
-        numObjInScene = randint(MINOBJ,MAXOBJ)
+        start = time.perf_counter()
+        numObjInScene = randint(self.config.MINOBJ,self.config.MAXOBJ)
         frames = self.seriesLength
-        scene = np.array([None]*(1+numObjInScene))   #scene contains the trajectories of the background and the drawn objects
-        scene[0], off = self.getBackground()        #get background image as trajectory and the offset to crop 
-        scene[0].getBgTrajectory(frames, offset = off) 
-        for i in range(numObjInScene):
-            image = self.images.getRandomObj()       
-            scene[i+1] = MoveableObject(img=image[0], filename = image[1], cvSize=self.size)  #i+1 because the scene starts with the background
-            scene[i+1].getTrajectory(frames)  #i+1 because the scene starts with the background 
+        scene = self.createScene(frames, numObjInScene)
         self.getFramesFromScene(frames, scene, numObjInScene)
         self.scene = scene
+        self.stats.addSeries(time.perf_counter()-start, frames)
         return self.output
+
+    def createScene(self, frames, numObjInScene):   #random background and objects with their trajectories, nothing is drawn
+        objects = [None]*(1+numObjInScene)   #the background and the drawn objects
+        with self.stats.timer("background"):
+            objects[0], off = self.getBackground()        #get background image as trajectory and the offset to crop 
+        with self.stats.timer("trajectory"):
+            objects[0].initBgTrajectory(offset = off) 
+            for i in range(numObjInScene):
+                image = self.images.getRandomObj()       
+                objects[i+1] = MoveableObject(img=image[0], filename = image[1], cvSize=self.size, pyramid=self.images.getPyramidFromKey(image[1]), config=self.config)  #i+1 because the scene starts with the background
+                objects[i+1].initTrajectory()  #i+1 because the scene starts with the background 
+            scene = Scene.fromObjects(objects, frames)  #scene contains the trajectories of the background and the drawn objects
+        return scene
     
-    def getSeriesFromFile(self, file=PATHTOTRAJECTORYFILE, offset=None, maxLength=None): #be careful, this method returns several scenes
+    def getSeriesFromFile(self, file=None, offset=None, maxLength=None): #be careful, this method returns several scenes
+        file = self.config.PATHTOTRAJECTORYFILE if file is None else file
         with open(file, 'r') as f:
             lines = f.readlines()
             
@@ -163,71 +296,153 @@ class ImageSeries():
         return output
 
     def getSeriesWithParam(self, frames, objectCount, trajectories, offset=0):
+        start = time.perf_counter()
         numObjInScene = objectCount
-        scene = np.array([None]*(1+numObjInScene))   #scene contains the trajectories of the background and the drawn objects
+        scene = Scene(1+numObjInScene, frames)   #scene contains the trajectories of the background and the drawn objects
         bg = trajectories[0]
-        img = self.images.getBgFromKey(bg['f'])
-        scene[0], off = self.getBackground([img, bg['f']], bg['cropPos'][0], bg['cropPos'][1])        #get background image as trajectory and the offset to crop 
-        scene[0].getBgTrajectory(frames, off, bg['toPos'])
-        for i in range(numObjInScene):
-            obj = trajectories[i+1]
-            image = self.images.getObjFromKey(obj['f'])
-            scene[i+1] = MoveableObject(image, obj['f'], obj['fromPos'], obj['fromS'], obj['fromR'], self.size, offset)  #i+1 because the scene starts with the background
-            scene[i+1].getTrajectoryWithParam(frames, obj['toPos'][0], obj['toPos'][1], obj['toS'], obj['toR'], obj['modes'])
-        self.getFramesFromScene(frames, scene, numObjInScene)
+        with self.stats.timer("background"):
+            img = self.images.getBgFromKey(bg['f'])
+            bgObject, off = self.getBackground([img, bg['f']], bg['cropPos'][0], bg['cropPos'][1])        #get background image as trajectory and the offset to crop 
+        with self.stats.timer("trajectory"):
+            bgObject.initBgTrajectory(off, bg['toPos'])
+            scene.setMoveableObject(0, bgObject)
+            for i in range(numObjInScene):
+                obj = trajectories[i+1]
+                image = self.images.getObjFromKey(obj['f'])
+                scene.setObject(i+1, image, obj['f'], self.images.getPyramidFromKey(obj['f']), obj['fromPos'], obj['toPos'], obj['fromS'], obj['toS'],
+                                obj['fromR'], obj['toR'], obj['modes'], offset)  #i+1 because the scene starts with the background
+        key = self.getCacheKey(frames, trajectories, offset)
+        cached = None if key is None else self.cache.get(key)
+        if(cached is not None):     #the scene is still built, so getTrajectoryFromScene and the offsets work as before
+            self.stats.count('seriesCacheHits')
+            for frame in range(frames):     #arrays like renderFrame returns them, copied because the cache is read only
+                self.output[frame] = cached[frame].copy()
+        else:
+            self.getFramesFromScene(frames, scene, numObjInScene)
+            if(key is not None):
+                self.stats.count('seriesCacheMisses')
+                self.cache.put(key, np.stack(self.output[:frames]))
         self.scene = scene
+        self.stats.addSeries(time.perf_counter()-start, frames)
         return self.output       
 
     def getSeriesWithOffsetFromSeries(self, offset):
-        if(WITHRANDOMTRAJECTORYOFFSET):
-            offset = uniform(TRAJECTORYOFFSET[0],TRAJECTORYOFFSET[1])
+        if(self.config.WITHRANDOMTRAJECTORYOFFSET):
+            offset = uniform(self.config.TRAJECTORYOFFSET[0],self.config.TRAJECTORYOFFSET[1])
         traj = getTrajectoryData(self.seriesLength, self.scene)        
         return self.getSeriesWithParam(traj['frames'], traj['objCount'], traj['trajectories'], offset)        
+
+    #Renders the last series (self.scene) again for every offset in offsets and returns them as one array with the
+    #shape (variants, frames, height, width, 4). Background crop, sprites and transformed sprites are shared by all
+    #variants, only the trajectories of the objects are computed again. Nothing is saved and self.output isn't changed.
+    def getSeriesWithOffsets(self, offsets):
+        if(not isinstance(self.scene, Scene)):
+            raise ValueError("render a series first")
+        start = time.perf_counter()
+        frames = self.seriesLength
+        out = np.empty((len(offsets), frames, self.size[1], self.size[0], 4), dtype=np.uint8)
+        with self.stats.timer("trajectory"):
+            scenes = [self.scene.withOffset(offset) for offset in offsets]
+        for frame in range(frames):     #frame by frame, so the variants use the same transformed sprites while they are in the cache
+            for variant in range(len(offsets)):
+                npImg = self.renderFrame(scenes[variant], frame)
+                if(self.config.IMAGENOISE):
+                    with self.stats.timer("noise"):
+                        npImg = addImageNoise(npImg, (self.size[0], self.size[1]), self.config.COMPILEDKERNELS)
+                out[variant, frame] = npImg
+        seconds = (time.perf_counter()-start)/max(len(offsets), 1)
+        for variant in range(len(offsets)):
+            self.stats.addSeries(seconds, frames)
+        return out
         
     def getBackground(self, bgFile=None, left=None, top=None):
         bgFile = self.images.getRandomBg() if bgFile is None else bgFile
         bgImg = bgFile[0] 
+        bgSize = getSize(bgImg)
         if(left is None):        
-            left = randint(0, bgImg.size[0]-self.size[0]-1-BGMAXTRANSLATION[0])   #just crops out parts of the background which really are on the img
+            left = randint(0, bgSize[0]-self.size[0]-1-self.config.BGMAXTRANSLATION[0])   #just crops out parts of the background which really are on the img
         if(top is None):
-            top  = randint(0, bgImg.size[1]-self.size[1]-1-BGMAXTRANSLATION[1])   #just crops out parts of the background which really are on the img
-        bgImg = bgImg.crop((left, top, left+self.size[0]+2*BGMAXTRANSLATION[0], top+self.size[1]+2*BGMAXTRANSLATION[1]))   #crop background with random variables
-        return MoveableObject(img=bgImg, filename = bgFile[1], pos=[-BGMAXTRANSLATION[0]+int(bgImg.size[0]/2.), -BGMAXTRANSLATION[1]+int(bgImg.size[1]/2.)], scale=1., rotation=0., cvSize=self.size) ,[left,top]       
+            top  = randint(0, bgSize[1]-self.size[1]-1-self.config.BGMAXTRANSLATION[1])   #just crops out parts of the background which really are on the img
+        box = (left, top, left+self.size[0]+2*self.config.BGMAXTRANSLATION[0], top+self.size[1]+2*self.config.BGMAXTRANSLATION[1])
+        if(isinstance(bgImg, backgroundStore.StoredBackground)):    #only the window is read
+            bgImg = self.backend.fromArray(bgImg.getRegion(box))
+        else:
+            bgImg = self.backend.crop(bgImg, box)   #crop background with random variables
+        bgSize = getSize(bgImg)
+        return MoveableObject(img=bgImg, filename = bgFile[1], pos=[-self.config.BGMAXTRANSLATION[0]+int(bgSize[0]/2.), -self.config.BGMAXTRANSLATION[1]+int(bgSize[1]/2.)], scale=1., rotation=0., cvSize=self.size, config=self.config) ,[left,top]       
         
     def getFramesFromScene(self, frames, scene, numObjInScene):
-        canvas = Image.new("RGBA", (self.size[0],self.size[1])) 
-        for frame in range(frames): 
-            newFrame = canvas.copy()
-            if(GETSEGMENTATIONMASK):
-                frameLayer = np.array([None]*len(scene))
-            for i in range(len(scene)):
-                obj = scene[i]
-                img = obj.img
-                traj = obj.traj[frame]
-                img = img.resize((int(round(img.size[0]*traj['s'])),int(round(img.size[1]*traj['s'])))).rotate(traj['r'], expand=1)   #scale first. If rotated, the size of the image is resized due expand=1!               
-                posX, posY = int(traj['x']-img.size[0]/2.), int(traj['y']-img.size[0]/2.)
-                if(GETSEGMENTATIONMASK):                        
-                    layer = Image.new("RGBA", (self.size[0],self.size[1]))
-                    layer.paste(img, (int(posX), int(posY)), img) 
-                    frameLayer[i] = np.array(layer)                
-                newFrame.paste(img, (posX,posY), img)
-                
-            npImg = np.array(newFrame)  #for faster pixel access convert image to np.array
-            if(IMAGENOISE):
-                self.output[frame] = addImageNoise(npImg, newFrame.size)
-            else:
-                self.output[frame] = npImg
-            if(GETSEGMENTATIONMASK):
+        labels = None
+        if(self.config.GETOPTICALFLOW):
+            import opticalFlow
+            labels = np.full((frames, self.size[1], self.size[0]), -1, dtype=np.int16)   #visible object for every pixel
+        def render(frame):  #every frame writes only its own entries of output, labels and segmentationLayers
+            frameLayer = np.array([None]*len(scene)) if self.config.GETSEGMENTATIONMASK else None
+            self.output[frame] = self.renderFrame(scene, frame, None if labels is None else labels[frame], frameLayer)
+            if(self.config.GETSEGMENTATIONMASK):
                 self.segmentationLayers[frame]=frameLayer
+        if(self.config.RENDERTHREADS > 1 and frames > 1):
+            list(self.getRenderPool().map(render, range(frames)))  #list() raises the errors of the threads
+        else:
+            for frame in range(frames): 
+                render(frame)
+        if(self.config.IMAGENOISE):     #after rendering, so the random numbers are drawn in the same order with threads
+            for frame in range(frames):
+                with self.stats.timer("noise"):
+                    self.output[frame] = addImageNoise(self.output[frame], (self.size[0], self.size[1]), self.config.COMPILEDKERNELS)
+        if(self.config.GETOPTICALFLOW):
+            self.imageFlow = opticalFlow.getOpticalFlow(scene, labels, frames)
 
         #Additional options
-        if(SAFEIMAGES):
+        if(self.config.SAFEIMAGES and self.config.LAYEREDIMAGES):
+            self.saveLayered()
+        elif(self.config.SAFEIMAGES):
             self.saveImages()
-        if(SAFETRAJECTORY):
-            safeTrajectory(frames, scene)
-        if(SAVESEGMENTATIONMASK):
+        if(self.config.SAFETRAJECTORY):
+            safeTrajectory(frames, scene, self.config.PATHTOTRAJECTORYFILE)
+        if(self.config.SAVESEGMENTATIONMASK):
             self.saveSegmentationMask()         
+        if(self.config.SAVEOPTICALFLOW):
+            self.saveFlow()
         
+    #Draws one frame of the scene and returns it as (height, width, 4) array. If labels is given, the index of the
+    #visible object is written for every pixel (optical flow), if layers is given, every object is drawn on its own layer too
+    def renderFrame(self, scene, frame, labels=None, layers=None):
+        backend = self.backend
+        newFrame = backend.newCanvas(self.size[0], self.size[1])
+        xs, ys, scales, rotations = scene.getFrame(frame)
+        sizes = scene.sizes.tolist()
+        for i in range(len(scene)):
+            srcW, srcH = sizes[i]
+            w, h = int(round(srcW*scales[i])), int(round(srcH*scales[i]))
+            imgW, imgH = renderBackends.getRotatedSize(w, h, rotations[i])    #size after scaling and rotating (expand=1)
+            posX, posY = int(xs[i]-imgW/2.), int(ys[i]-imgW/2.)
+            if(labels is not None):
+                scene.placements[i, frame] = (posX, posY, imgW, imgH, w/float(srcW), h/float(srcH), rotations[i])
+            if(w <= 0 or h <= 0 or posX >= self.size[0] or posY >= self.size[1] or posX+imgW <= 0 or posY+imgH <= 0):
+                self.stats.count('culledObjects')    #not on the canvas, nothing to draw
+                if(layers is not None):
+                    layers[i] = backend.toArray(backend.newCanvas(self.size[0], self.size[1]))
+                continue
+            self.stats.count('drawnObjects')
+            start = time.perf_counter()
+            img = self.getTransformedSprite(scene.getImageForSize(i, w, h), w, h, rotations[i])   #scale first. If rotated, the size of the image is resized due expand=1!               
+            self.stats.addTime("transform", time.perf_counter()-start)
+            start = time.perf_counter()
+            if(labels is not None):
+                kernels = self.getKernels()
+                if(kernels is not None):
+                    kernels.pasteLabel(labels, backend.getAlpha(img), posX, posY, i)
+                else:
+                    import opticalFlow
+                    opticalFlow.pasteLabel(labels, backend.getAlpha(img), posX, posY, i)
+            if(layers is not None):                        
+                layer = backend.newCanvas(self.size[0], self.size[1])
+                layers[i] = backend.toArray(backend.paste(layer, img, posX, posY))
+            newFrame = backend.paste(newFrame, img, posX, posY)
+            self.stats.addTime("paste", time.perf_counter()-start)
+        return backend.toArray(newFrame)  #for faster pixel access convert image to np.array
+
     def saveSegmentationMask(self, withBg=False, folder="test", filename="segmentationMask"):
         start = 0 if(withBg) else 1
         for frame in range(len(self.segmentationLayers)):
@@ -237,10 +452,89 @@ class ImageSeries():
     def getSegmentationMask(self):  #just returns the layer. If global GETSEGMENTATIONMASK is not set, the output is empty
         return self.segmentationLayers
 
-    def saveImages(self, folder=SERIESFOLDER, name=SERIESNAME):
+    def getOpticalFlow(self):   #imageFlow[frame] is the flow from frame to frame+1. If global GETOPTICALFLOW is not set, the output is empty
+        return self.imageFlow
+
+    def saveImages(self, folder=None, name=None):
+        folder = self.config.SERIESFOLDER if folder is None else folder
+        name = self.config.SERIESNAME if name is None else name
         for i in range(len(self.output)):
-            Image.fromarray(self.output[i]).save(getFilename(folder, name, self.seriesLength, i))
+            with self.stats.timer("encode"):
+                data = encodePng(self.output[i])
+            with self.stats.timer("write"):
+                writeFile(getFilename(folder, name, self.seriesLength, i), data)
         
+    def saveLayered(self, folder=None, name=None):     #all frames in one file name+".lseq", see layeredSeries
+        import layeredSeries
+        folder = self.config.SERIESFOLDER if folder is None else folder
+        name = self.config.SERIESNAME if name is None else name
+        with self.stats.timer("encode"):
+            data = layeredSeries.encodeLayered(self.output)
+        with self.stats.timer("write"):
+            writeFile(folder+"/"+name+layeredSeries.ENDING, data)
+
+    def saveFlow(self, folder=None, name=None):  #the flow of the frame is saved as name+"Flow" with the ending .flo and .png
+        import opticalFlow
+        folder = self.config.SERIESFOLDER if folder is None else folder
+        name = self.config.SERIESNAME if name is None else name
+        for i in range(len(self.imageFlow)):
+            if(self.imageFlow[i] is not None):  #the last frame has no successor
+                with self.stats.timer("encode"):
+                    flo = opticalFlow.encodeFlo(self.imageFlow[i])
+                    png = opticalFlow.encodeFlowPng(self.imageFlow[i])
+                with self.stats.timer("write"):
+                    writeFile(getFilename(folder, name+"Flow", self.seriesLength, i, ".flo"), flo)
+                    writeFile(getFilename(folder, name+"Flow", self.seriesLength, i, ".png"), png)
+
+    def getKernels(self):   #fastKernels if COMPILEDKERNELS is set and numba is installed, otherwise None (NumPy code)
+        if(not self.config.COMPILEDKERNELS):
+            return None
+        import fastKernels
+        return fastKernels if fastKernels.AVAILABLE else None
+
+    def getCacheKey(self, frames, trajectories, offset):   #None if there is no cache or the series has other outputs than the frames
+        if(self.cache is None or not seriesCache.isCacheable(self.config)):
+            return None
+        return seriesCache.getKey(frames, trajectories, offset, self.config, self.backend.name, self.size)
+
+    def getRenderPool(self):    #created with the first series which needs it, the threads are kept for the next series
+        if(self.renderPool is None):
+            from concurrent.futures import ThreadPoolExecutor
+            self.renderPool = ThreadPoolExecutor(self.config.RENDERTHREADS)
+        return self.renderPool
+
+    #transformed sprites are cached. The cache keeps a reference to the source image, so its id can't be reused.
+    #The transform itself runs without the lock, two threads may transform the same sprite then (same result).
+    #With PREMULTIPLIEDSPRITES a sprite is premultiplied when it is used the second time, most sprites are pasted only
+    #once (the scale or rotation changes every frame) and premultiplying them would cost more than it saves
+    def getTransformedSprite(self, img, w, h, r):
+        key = (id(img), w, h, r)
+        with self.spriteCacheLock:
+            entry = self.spriteCache.get(key)
+            if(entry is not None and entry[0] is img):
+                self.spriteCache.move_to_end(key)
+                self.stats.count('spriteCacheHits')
+                if(not self.config.PREMULTIPLIEDSPRITES):
+                    return entry[1]
+        if(entry is not None and entry[0] is img):
+            transformed = self.backend.premultiply(entry[1])    #the same object if it is premultiplied already
+            if(transformed is not entry[1]):
+                with self.spriteCacheLock:
+                    if(key in self.spriteCache):
+                        self.spriteCache[key] = (img, transformed)
+            return transformed
+        self.stats.count('spriteCacheMisses')
+        transformed = self.backend.transform(img, w, h, r)
+        if(self.config.SPRITECACHESIZE > 0):
+            with self.spriteCacheLock:
+                self.spriteCache[key] = (img, transformed)
+                if(len(self.spriteCache) > self.config.SPRITECACHESIZE):
+                    self.spriteCache.popitem(last=False)
+        return transformed
+
+    def getStats(self):     #timing of the stages and counters, see seriesStats
+        return self.stats
+
     def getTrajectoryFromScene(self):
         return getTrajectoryData(self.seriesLength, self.scene)
     
@@ -251,12 +545,14 @@ class ImageSeries():
         return ""
 
 class MoveableObject():
-    def __init__(self, img, filename=None, pos=None, scale=None, rotation=None, cvSize=None, offset=None):
+    def __init__(self, img, filename=None, pos=None, scale=None, rotation=None, cvSize=None, offset=None, pyramid=None, config=None):
+        self.config = getConfig() if config is None else config
         self.img = img
+        self.pyramid = pyramid  #list of the mip levels of img (see buildPyramid). None uses img for every scale
         self.filename = filename if filename is not None else img.filename
-        self.canvasSize = SIZE if cvSize is None else cvSize    #cvSize is the size of the canvas. initialized with global variable
+        self.canvasSize = self.config.SIZE if cvSize is None else cvSize    #cvSize is the size of the canvas. initialized with the config
 
-        self.scale = scale if scale is not None else uniform(MINSCALE, MAXSCALE) #since we operate with floating point variables, this is uniform not randint  
+        self.scale = scale if scale is not None else uniform(self.config.MINSCALE, self.config.MAXSCALE) #since we operate with floating point variables, this is uniform not randint  
         self.toScale = self.scale #just initializes the value. If not set, nothing happens! 
 
         if pos is None:
@@ -274,62 +570,51 @@ class MoveableObject():
         
         self.modes = [1,1,1,1]  #initialized with linear acceleratingMode
         self.traj = {}
+        self.placement = {}     #position, size and transformation of the drawn image per frame. Needed for the optical flow
         self.param = {}
 
     def getTrajectory(self, frames): 
-        #init all values
-        self.toPos = getPossibleCoordinates(self.pos, self.canvasSize)
-        self.toScale = uniform(MINSCALE, MAXSCALE)     #since we operate with floating point variables, this is uniform not randint
-        self.toRotation = self.rotation + uniform(MINROTATE, MAXROTATE)  #since we operate with floating point variables, this is uniform not randint        
-        translateModeX = randint(0, len(TRANSLATIONMODEX)-1)            
-        translateModeY = randint(0, len(TRANSLATIONMODEY)-1)
-        scaleMode = randint(0, len(SCALEMODE)-1)
-        rotationMode = randint(0, len(ROTATIONMODE)-1)
+        self.initTrajectory()
+        return self.getTrajectoryWithParam(frames, self.toPos[0], self.toPos[1], self.toScale, self.toRotation, self.modes)
+
+    def initTrajectory(self):   #random target values, the values of the frames are computed by getTrajectoryWithParam or Scene
+        self.toPos = getPossibleCoordinates(self.pos, self.canvasSize, config=self.config)
+        self.toScale = uniform(self.config.MINSCALE, self.config.MAXSCALE)     #since we operate with floating point variables, this is uniform not randint
+        self.toRotation = self.rotation + uniform(self.config.MINROTATE, self.config.MAXROTATE)  #since we operate with floating point variables, this is uniform not randint        
+        translateModeX = randint(0, len(self.config.TRANSLATIONMODEX)-1)            
+        translateModeY = randint(0, len(self.config.TRANSLATIONMODEY)-1)
+        scaleMode = randint(0, len(self.config.SCALEMODE)-1)
+        rotationMode = randint(0, len(self.config.ROTATIONMODE)-1)
         self.modes=[translateModeX, translateModeY, scaleMode, rotationMode]
         
-        #apply trajectory
-        step = 1./(frames-1) #-1 to include the last frame
-        for frame in range(frames):   
-            newx = round(acceleratingMode(translateModeX, self.toPos[0]-self.pos[0], frame, step))
-            newy = round(acceleratingMode(translateModeY, self.toPos[1]-self.pos[1], frame, step))
-            news = acceleratingMode(scaleMode, self.toScale-self.scale, frame, step)
-            newr = acceleratingMode(rotationMode, self.toRotation-self.rotation, frame, step)
-            self.traj[frame]={'x':self.pos[0]+newx,'y':self.pos[1]+newy,'s':self.scale+news,'r':self.rotation+newr}
-        return self.traj   
-        
     def getBgTrajectory(self, frames, offset, toPos=None):
-        #init all values
-        if(MOVEABLEBACKGROUND):
+        self.initBgTrajectory(offset, toPos)
+        return self.getTrajectoryWithParam(frames, self.toPos[0], self.toPos[1], self.toScale, self.toRotation, self.modes)
+
+    def initBgTrajectory(self, offset, toPos=None):
+        if(self.config.MOVEABLEBACKGROUND):
             if(toPos is not None):
                 self.toPos = toPos
             else:
-                toX = self.pos[0]+randint(-BGMAXTRANSLATION[0], BGMAXTRANSLATION[0])
-                toY = self.pos[1]+randint(-BGMAXTRANSLATION[1], BGMAXTRANSLATION[1])        
+                toX = self.pos[0]+randint(-self.config.BGMAXTRANSLATION[0], self.config.BGMAXTRANSLATION[0])
+                toY = self.pos[1]+randint(-self.config.BGMAXTRANSLATION[1], self.config.BGMAXTRANSLATION[1])        
                 self.toPos=[toX, toY]
         self.toScale = 1.
         self.toRotation = 0.     
         self.modes = [0,0,0,0]
         self.cropPos = offset
-        #apply trajectory
-        step = 1./(frames-1) #-1 to include the last frame
-        for frame in range(frames):   
-            newx = round(acceleratingMode(0, self.toPos[0]-self.pos[0], frame, step))
-            newy = round(acceleratingMode(0, self.toPos[1]-self.pos[1], frame, step))
-            news = acceleratingMode(0, self.toScale-self.scale, frame, step)
-            newr = acceleratingMode(0, self.toRotation-self.rotation, frame, step)
-            self.traj[frame]={'x':self.pos[0]+newx,'y':self.pos[1]+newy,'s':self.scale+news,'r':self.rotation+newr}
-        return self.traj   
     
     def getTrajectoryWithParam(self, frames, toX, toY, scale, rotate, modes): 
-        step = 1./(frames-1)+self.offset   #-1 to include the last frame
+        self.toPos, self.toScale, self.toRotation, self.modes = [toX, toY], scale, rotate, list(modes)
+        values = getTrajectoryValues(frames, self.pos, self.toPos, self.scale, self.toScale, self.rotation, self.toRotation, self.modes, self.offset)
         for frame in range(frames):
-            newx = round(acceleratingMode(modes[0], toX-self.pos[0], frame, step))
-            newy = round(acceleratingMode(modes[1], toY-self.pos[1], frame, step))
-            news = acceleratingMode(modes[2], scale-self.scale, frame, step)
-            newr = acceleratingMode(modes[3], rotate-self.rotation, frame, step)
-            self.traj[frame]={'x':self.pos[0]+newx,'y':self.pos[1]+newy,'s':self.scale+news,'r':self.rotation+newr}
+            x, y, s, r = values[frame]
+            self.traj[frame]={'x':x,'y':y,'s':s,'r':r}
         return self.traj
         
+    def getImageForSize(self, width, height):
+        return getPyramidLevel(self.img, self.pyramid, width, height)
+
     def getData(self): #brauche ich spaeter zum speichern der trajektorien
         data = {}
         data['f'] = self.filename
@@ -355,6 +640,148 @@ class MoveableObject():
             print (frame, self.traj[frame])
         return ""   #easier then making an object to print!
     
+#The scene of a series as struct of arrays. Index 0 is the background, the objects follow in drawing order.
+#The parameters of the trajectories and the values of every frame are numpy arrays, which are read directly by the
+#renderer and the trajectory writer. scene[i] returns a SceneObject, a view with the attributes of a MoveableObject.
+class Scene():
+    def __init__(self, count, frames):
+        self.frames = frames
+        self.keys = [None]*count        #filenames of the images
+        self.images = [None]*count
+        self.pyramids = [None]*count
+        self.sizes = np.zeros((count, 2), dtype=np.int64)      #width and height of the images
+        self.fromPos = np.zeros((count, 2), dtype=np.int64)
+        self.toPos = np.zeros((count, 2), dtype=np.int64)
+        self.cropPos = np.zeros((count, 2), dtype=np.int64)
+        self.fromScale = np.ones(count)
+        self.toScale = np.ones(count)
+        self.fromRotation = np.zeros(count)
+        self.toRotation = np.zeros(count)
+        self.modes = np.zeros((count, 4), dtype=np.int8)
+        self.offsets = np.zeros(count)
+        self.positions = np.zeros((count, frames, 2), dtype=np.int64)    #middle of the image in every frame
+        self.scales = np.ones((count, frames))
+        self.rotations = np.zeros((count, frames))
+        self.placements = np.zeros((count, frames, 7))     #written by the renderer for the optical flow, see opticalFlow.getPlacementMatrix
+
+    @staticmethod
+    def fromObjects(objects, frames):   #MoveableObjects with initialized trajectories (initTrajectory/initBgTrajectory)
+        scene = Scene(len(objects), frames)
+        for i in range(len(objects)):
+            scene.setMoveableObject(i, objects[i])
+        return scene
+
+    def setMoveableObject(self, i, obj):
+        self.setObject(i, obj.img, obj.filename, obj.pyramid, obj.pos, obj.toPos, obj.scale, obj.toScale, obj.rotation, obj.toRotation,
+                       obj.modes, obj.offset, obj.cropPos)
+
+    #Sets the parameters of object i and computes its values for every frame
+    def setObject(self, i, img, key, pyramid, pos, toPos, scale, toScale, rotation, toRotation, modes, offset=0, cropPos=(0, 0)):
+        self.keys[i], self.images[i], self.pyramids[i] = key, img, pyramid
+        self.sizes[i] = getSize(img)
+        self.fromPos[i], self.toPos[i], self.cropPos[i] = pos, toPos, cropPos
+        self.fromScale[i], self.toScale[i] = scale, toScale
+        self.fromRotation[i], self.toRotation[i] = rotation, toRotation
+        self.modes[i], self.offsets[i] = modes, offset
+        values = getTrajectoryValues(self.frames, self.fromPos[i].tolist(), self.toPos[i].tolist(), float(scale), float(toScale),
+                                     float(rotation), float(toRotation), self.modes[i].tolist(), float(offset))
+        self.positions[i] = [value[:2] for value in values]
+        self.scales[i] = [value[2] for value in values]
+        self.rotations[i] = [value[3] for value in values]
+
+    #Copy with another offset for the objects (the background keeps its offset). The images are shared
+    def withOffset(self, offset):
+        scene = Scene(len(self), self.frames)
+        for i in range(len(self)):
+            scene.setObject(i, self.images[i], self.keys[i], self.pyramids[i], self.fromPos[i], self.toPos[i], self.fromScale[i], self.toScale[i],
+                            self.fromRotation[i], self.toRotation[i], self.modes[i], offset if i > 0 else self.offsets[i], self.cropPos[i])
+        return scene
+
+    def getFrame(self, frame):  #x, y, scale and rotation of all objects in the frame as lists
+        return (self.positions[:, frame, 0].tolist(), self.positions[:, frame, 1].tolist(),
+                self.scales[:, frame].tolist(), self.rotations[:, frame].tolist())
+
+    def getImageForSize(self, i, width, height):
+        return getPyramidLevel(self.images[i], self.pyramids[i], width, height)
+
+    def getData(self):  #parameters of all objects as saved in the trajectory file (same as MoveableObject.getData)
+        fromPos, toPos, cropPos, modes = self.fromPos.tolist(), self.toPos.tolist(), self.cropPos.tolist(), self.modes.tolist()
+        fromScale, toScale, fromRotation, toRotation = self.fromScale.tolist(), self.toScale.tolist(), self.fromRotation.tolist(), self.toRotation.tolist()
+        offsets = self.offsets.tolist()
+        return [{'f': self.keys[i], 'fromPos': fromPos[i], 'toPos': toPos[i], 'cropPos': cropPos[i], 'fromS': fromScale[i], 'toS': toScale[i],
+                 'fromR': fromRotation[i], 'toR': toRotation[i], 'modes': modes[i], 'offset': offsets[i]} for i in range(len(self))]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, index):
+        if(isinstance(index, slice)):
+            return [SceneObject(self, i) for i in range(len(self))[index]]
+        if(index < 0):
+            index += len(self)
+        if(not 0 <= index < len(self)):
+            raise IndexError("scene index out of range")
+        return SceneObject(self, index)
+
+#One object of a Scene. No data is copied, the attributes are read from the arrays of the scene
+class SceneObject():
+    __slots__ = ("scene", "index")
+
+    def __init__(self, scene, index):
+        self.scene = scene
+        self.index = index
+
+    img = property(lambda self: self.scene.images[self.index])
+    filename = property(lambda self: self.scene.keys[self.index])
+    pyramid = property(lambda self: self.scene.pyramids[self.index])
+    pos = property(lambda self: self.scene.fromPos[self.index].tolist())
+    toPos = property(lambda self: self.scene.toPos[self.index].tolist())
+    cropPos = property(lambda self: self.scene.cropPos[self.index].tolist())
+    scale = property(lambda self: float(self.scene.fromScale[self.index]))
+    toScale = property(lambda self: float(self.scene.toScale[self.index]))
+    rotation = property(lambda self: float(self.scene.fromRotation[self.index]))
+    toRotation = property(lambda self: float(self.scene.toRotation[self.index]))
+    modes = property(lambda self: self.scene.modes[self.index].tolist())
+    offset = property(lambda self: float(self.scene.offsets[self.index]))
+
+    @property
+    def traj(self):     #{frame: {'x', 'y', 's', 'r'}} like MoveableObject.traj
+        positions, scales, rotations = self.scene.positions[self.index].tolist(), self.scene.scales[self.index].tolist(), self.scene.rotations[self.index].tolist()
+        return dict((frame, {'x': positions[frame][0], 'y': positions[frame][1], 's': scales[frame], 'r': rotations[frame]}) for frame in range(self.scene.frames))
+
+    @property
+    def placement(self):
+        return dict((frame, tuple(self.scene.placements[self.index, frame].tolist())) for frame in range(self.scene.frames))
+
+    def getImageForSize(self, width, height):
+        return self.scene.getImageForSize(self.index, width, height)
+
+    def getData(self):
+        return self.scene.getData()[self.index]
+
+    def __str__(self):
+        return MoveableObject.__str__(self)
+
+#Values (x, y, scale, rotation) of every frame. The offset is added to the step, so the object moves further
+def getTrajectoryValues(frames, pos, toPos, scale, toScale, rotation, toRotation, modes, offset=0):
+    step = 1./(frames-1)+offset   #-1 to include the last frame
+    values = []
+    for frame in range(frames):
+        newx = round(acceleratingMode(modes[0], toPos[0]-pos[0], frame, step))
+        newy = round(acceleratingMode(modes[1], toPos[1]-pos[1], frame, step))
+        news = acceleratingMode(modes[2], toScale-scale, frame, step)
+        newr = acceleratingMode(modes[3], toRotation-rotation, frame, step)
+        values.append((pos[0]+newx, pos[1]+newy, scale+news, rotation+newr))
+    return values
+
+def getPyramidLevel(img, pyramid, width, height):   #smallest level of the pyramid, which is still larger than the requested size
+    if(pyramid is None):
+        return img
+    for level in reversed(pyramid):
+        if(getSize(level)[0] >= width and getSize(level)[1] >= height):
+            return level
+    return pyramid[0]  #scale >1 can only be done with the original image
+
 #0=nothing, 1=linear, 2=quadratic, 3=sqrt, 4=accelerating&breaking    
 def acceleratingMode(mode, val, frame, step):
     if mode == 4:
@@ -369,30 +796,78 @@ def acceleratingMode(mode, val, frame, step):
         newVal = val 
     return newVal
 
+#Level 0 is the image itself, every following level has half the size of the previous one.
+#The levels are always resampled from the original image.
+def buildPyramid(img, minSize=MINPYRAMIDSIZE):
+    pyramid = [img]
+    w, h = img.size
+    while(min(w, h) >= 2*minSize):
+        w, h = int(math.ceil(w/2.)), int(math.ceil(h/2.))
+        pyramid.append(img.resize((w, h), Image.LANCZOS))
+    return pyramid
+
+#The cache file depends on the path, the size and the last modification of the image
+def getPyramidCacheFile(file, cacheFolder, minSize=MINPYRAMIDSIZE):
+    import hashlib
+    stat = os.stat(file)
+    key = "%s|%d|%f|%d" % (os.path.abspath(file), stat.st_size, stat.st_mtime, minSize)
+    return cacheFolder+"/"+hashlib.sha1(key.encode('utf-8')).hexdigest()+".npz"
+
+def loadPyramid(file, img, cacheFolder=None, minSize=MINPYRAMIDSIZE):
+    if(cacheFolder is None):
+        return buildPyramid(img, minSize)
+    cacheFile = getPyramidCacheFile(file, cacheFolder, minSize)
+    if(os.path.exists(cacheFile)):
+        with np.load(cacheFile) as data:
+            return [img]+[Image.fromarray(data['level%d' % i]) for i in range(1, len(data.files)+1)]
+    pyramid = buildPyramid(img, minSize)
+    if(not os.path.exists(cacheFolder)):
+        os.makedirs(cacheFolder)
+    levels = {}
+    for i in range(1, len(pyramid)):
+        levels['level%d' % i] = np.asarray(pyramid[i])
+    tmpFile = cacheFile+".%d.tmp" % os.getpid()   #several processes could write the same cache file
+    with open(tmpFile, 'wb') as f:
+        np.savez(f, **levels)
+    os.replace(tmpFile, cacheFile)
+    return pyramid
+
+def encodePng(img):
+    buf = io.BytesIO()
+    Image.fromarray(img).save(buf, "PNG")
+    return buf.getvalue()
+
+def writeFile(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
 #if the images should be saved, you can get the filenames with the following function    
-def getFilename(folder, imgName, seriesLength, frame):
+def getFilename(folder, imgName, seriesLength, frame, ending=".png"):
     b = len(str(seriesLength))
     f = len(str(frame))
-    return folder+"/"+"0"*(b-f)+str(frame)+imgName+".png"    
+    return folder+"/"+"0"*(b-f)+str(frame)+imgName+ending    
 
 def getTrajectoryData(frames, scene):
     data={}
     data['frames'] = frames
     data['objCount'] = len(scene)-1 #background not counted
-    objects = [None]*len(scene)
-    for i in range(len(scene)):
-        objects[i] = scene[i].getData()
+    if(isinstance(scene, Scene)):
+        objects = scene.getData()
+    else:   #list of MoveableObjects
+        objects = [None]*len(scene)
+        for i in range(len(scene)):
+            objects[i] = scene[i].getData()
     data['trajectories'] = objects
     return data
     
-def safeTrajectory(frames, scene):
+def safeTrajectory(frames, scene, file=PATHTOTRAJECTORYFILE):
     data = getTrajectoryData(frames, scene)
     tempStr = json.dumps(data)+"\n"
-    with open(PATHTOTRAJECTORYFILE, 'a') as f:  #json dump can't append to a file, so dump it in a string and write this to a file  
+    with open(file, 'a') as f:  #json dump can't append to a file, so dump it in a string and write this to a file  
         f.write(tempStr)    
 
-def keepMiddlepointOnCanvas(canvasSize, newPos):    #This functions returns a boolean for getPossibleCoordinates. If True no rejection
-    if(KEEPMIDDLEOFIMAGEONCANVAS):
+def keepMiddlepointOnCanvas(canvasSize, newPos, keepMiddle=KEEPMIDDLEOFIMAGEONCANVAS):    #This functions returns a boolean for getPossibleCoordinates. If True no rejection
+    if(keepMiddle):
         if(0 <= newPos[0] <= canvasSize[0] and 0 <= newPos[1] <= canvasSize[1]):
             return True
         else:
@@ -400,7 +875,12 @@ def keepMiddlepointOnCanvas(canvasSize, newPos):    #This functions returns a bo
     else:
         return True
          
-def addImageNoise(img, size): #noise range is normally distributed
+def addImageNoise(img, size, compiled=False): #noise range is normally distributed
+    if(compiled and size[0] <= img.shape[0] and size[1] <= img.shape[1]):
+        import fastKernels
+        if(fastKernels.AVAILABLE):  #drawn by numpy in one call, seeded from random, so random.seed still repeats the noise
+            draws = np.random.default_rng(getrandbits(64)).random((size[0], size[1], 3))
+            return fastKernels.addNoise(img, draws)
     def noise(val):     #used closure, because noise not needed elsewhere
         absval = abs(val)
         if (absval>=0.56):
@@ -419,7 +899,7 @@ def addImageNoise(img, size): #noise range is normally distributed
         for y in range(size[1]):
             col = (noise(1-uniform(0,2)), noise(1-uniform(0,2)), noise(1-uniform(0,2)))  #right bound is not included. should not matter that much.
             for i in range(3):  #only use rgb, not alpha
-                dc = img[x][y][i]-col[i]
+                dc = int(img[x][y][i])-col[i]   #int, a uint8 can't get negative
                 if(dc>=0 and dc<=255):
                     img[x][y][i]=dc
     return img
@@ -430,8 +910,9 @@ def sign(val):
     else:
         return -1
   
-def getPossibleCoordinates(fromPos, cvSize, a=None):
-    a = DEFLECTIONBORDERLENGTH/2. if a is None else a
+def getPossibleCoordinates(fromPos, cvSize, a=None, config=None):
+    config = getConfig() if config is None else config
+    a = config.DEFLECTIONBORDERLENGTH/2. if a is None else a
     counter = 0
     while(True):
         counter+=1
@@ -439,7 +920,7 @@ def getPossibleCoordinates(fromPos, cvSize, a=None):
             print("Warning: needed 1000 attempts to find new coordinates for trajectory")
         newPos = [None, None]
         alpha = uniform(0, 2*np.pi)
-        translationLength = uniform(TRANSLATIONLENGTH[0],TRANSLATIONLENGTH[1])
+        translationLength = uniform(config.TRANSLATIONLENGTH[0],config.TRANSLATIONLENGTH[1])
         
         if(a==0):
             x = math.floor(fromPos[0]+np.cos(alpha)*translationLength)
@@ -463,6 +944,6 @@ def getPossibleCoordinates(fromPos, cvSize, a=None):
                 if(alpha < np.pi+alpha2 or alpha > 2*np.pi - alpha2):
                     newPos[1] = math.floor(fromPos[1]-np.sin(alpha)*translationLength) 
             
-            if(newPos[0] is not None and newPos[1] is not None and keepMiddlepointOnCanvas(cvSize, newPos)):
+            if(newPos[0] is not None and newPos[1] is not None and keepMiddlepointOnCanvas(cvSize, newPos, config.KEEPMIDDLEOFIMAGEONCANVAS)):
                 return newPos
 
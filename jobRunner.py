@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#Runs generation jobs from a job spec (json file). Every job has its own config, seed, number of series, output sink
+#and number of workers, so jobs with different configs can run at the same time on one machine:
+#   python jobRunner.py jobs.json
+#   {"jobs": [{"name": "small", "series": 10000, "seed": 1, "workers": 4, "backend": "numpy",
+#              "sink": {"type": "shard", "folder": "out/small", "seriesPerShard": 1000},
+#              "config": {"SIZE": [64, 64], "MAXOBJ": 2}},
+#             {"name": "large", "series": 500, "workers": 2, "sink": {"type": "folder", "folder": "out/large"}}]}
+#Values which are not in "config" are taken from finalImageSeries. Every series is seeded with the seed of the job and its
+#index, so the series with index i is always the same, no matter which worker creates it.
+#The finished tasks of a job are saved in a checkpoint in the output folder of the job. If the same job is started
+#again, only the missing tasks are run. Unfinished series and shards of a stopped run are written again.
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from multiprocessing import Pool
+import finalImageSeries
+import outputSink
+
+JOBDEFAULTS = {'name': None, 'seed': 0, 'series': 1, 'workers': 1, 'backend': None, 'backgrounds': None, 'objects': None,
+               'sink': {'type': 'folder'}, 'seriesPerTask': 100, 'config': {}}
+SINKTYPES = ["folder", "shard", "layered"]
+CHECKPOINTFILENAME = "checkpoint.json"
+CHECKPOINTINTERVAL = 10     #seconds between two checkpoints of a job, the last one is always written
+Job = namedtuple("Job", list(JOBDEFAULTS.keys()))
+
+#Checks the spec and returns an (immutable) Job. The config of the job is a SeriesConfig
+def getJob(spec, number=0):
+    unknown = [key for key in spec if key not in JOBDEFAULTS]
+    if(len(unknown) > 0):
+        raise ValueError("unknown job values: "+", ".join(unknown))
+    values = dict(JOBDEFAULTS)
+    values.update(spec)
+    values['name'] = "job%d" % number if values['name'] is None else str(values['name'])
+    sink = {'type': 'folder', 'folder': None, 'name': None, 'seriesPerShard': 1000}
+    sink.update(values['sink'])
+    if(sink['type'] not in SINKTYPES):
+        raise ValueError("unknown sink type: "+str(sink['type'])+" (possible: "+", ".join(SINKTYPES)+")")
+    #the sink writes the series, so the config must not save them again
+    config = finalImageSeries.getConfig(**dict(values['config'], SAFEIMAGES=False, SAVEOPTICALFLOW=False))
+    sink['folder'] = config.SERIESFOLDER+"/"+values['name'] if sink['folder'] is None else sink['folder']
+    sink['name'] = config.SERIESNAME if sink['name'] is None else sink['name']
+    if(sink['type'] == "shard"):
+        values['seriesPerTask'] = sink['seriesPerShard']    #every task writes exactly one shard
+    values['sink'] = tuple(sorted(sink.items()))
+    values['config'] = config
+    if(values['series'] < 0 or values['workers'] < 1 or values['seriesPerTask'] < 1):
+        raise ValueError("series must be >= 0, workers and seriesPerTask >= 1 (job "+values['name']+")")
+    return Job(**values)
+
+def loadJobs(file):     #the file contains one job or {"jobs": [...]}
+    with open(file, 'r') as f:
+        spec = json.load(f)
+    specs = spec['jobs'] if 'jobs' in spec else [spec]
+    jobs = [getJob(specs[i], i) for i in range(len(specs))]
+    names = [job.name for job in jobs]
+    if(len(set(names)) != len(names)):
+        raise ValueError("the names of the jobs have to be unique")
+    return jobs
+
+def seedSeries(seed, index):    #a string seed is hashed with sha512, so it is the same in every process
+    random.seed("%s/%d" % (seed, index))
+
+def getSink(job, firstIndex):
+    sink = dict(job.sink)
+    if(sink['type'] == "shard"):
+        return outputSink.ShardSink(sink['folder'], sink['name'], sink['seriesPerShard'], firstShard=firstIndex//sink['seriesPerShard'])
+    if(sink['type'] == "layered"):
+        return outputSink.LayeredSink(sink['folder'], sink['name'])
+    return outputSink.FolderSink(sink['folder'], sink['name'])
+
+#Every worker process loads the images of a job once and keeps the ImageSeries for its following tasks
+workerSeries = {}
+
+def getJobSeries(job):
+    if(job.name not in workerSeries):
+        import renderBackends
+        backend = None if job.backend is None else renderBackends.getBackend(job.backend)
+        workerSeries[job.name] = finalImageSeries.ImageSeries(job.backgrounds, job.objects, None, 0, backend, job.config)
+    return workerSeries[job.name]
+
+def getTasks(job, completed=()):  #(job, first index, last index+1) of every task which isn't completed
+    tasks = []
+    for start in range(0, job.series, job.seriesPerTask):
+        stop = min(start+job.seriesPerTask, job.series)
+        if((start, stop) not in completed):
+            tasks.append((job, start, stop))
+    return tasks
+
+#Everything which changes the output of a task. A checkpoint is only used for the same key
+def getJobKey(job):
+    data = {'seed': job.seed, 'seriesPerTask': job.seriesPerTask, 'backend': job.backend, 'backgrounds': job.backgrounds,
+            'objects': job.objects, 'sink': job.sink, 'config': job.config._asdict()}
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+def getCheckpointFile(job):
+    return dict(job.sink)['folder']+"/"+CHECKPOINTFILENAME
+
+def loadCheckpoint(job):    #returns the set of completed tasks (start, stop)
+    file = getCheckpointFile(job)
+    if(not os.path.exists(file)):
+        return set()
+    with open(file, 'r') as f:
+        data = json.load(f)
+    if(data['key'] != getJobKey(job)):
+        raise ValueError("the checkpoint "+file+" belongs to another job config. Delete it or use another output folder")
+    return set(tuple(task) for task in data['completed'])
+
+#Written to a temporary file first, so a stopped run never leaves a broken checkpoint
+def saveCheckpoint(job, completed):
+    file = getCheckpointFile(job)
+    if(not os.path.exists(os.path.dirname(file))):
+        os.makedirs(os.path.dirname(file))
+    sink = dict(job.sink)
+    data = {'key': getJobKey(job), 'name': job.name, 'seed': job.seed, 'series': job.series,
+            'completedSeries': sum(stop-start for start, stop in completed), 'completed': sorted(completed)}
+    if(sink['type'] == "shard"):    #shard i holds the series i*seriesPerShard ... (i+1)*seriesPerShard-1
+        data['shards'] = sorted(start//sink['seriesPerShard'] for start, stop in completed)
+    with open(file+".tmp", 'w') as f:
+        json.dump(data, f)
+    os.replace(file+".tmp", file)
+
+#addTask is called by the result thread of the pool for every finished task of the job
+class Checkpoint():
+    def __init__(self, job, completed):
+        self.job = job
+        self.completed = set(completed)
+        self.lastSave = time.time()
+        self.done = 0
+        self.lock = threading.Lock()
+
+    def addTask(self, result):
+        name, start, stop, series = result
+        with self.lock:
+            self.completed.add((start, stop))
+            self.done += stop-start
+        if(time.time()-self.lastSave >= CHECKPOINTINTERVAL):
+            self.save()
+
+    def save(self):
+        with self.lock:
+            saveCheckpoint(self.job, self.completed)
+            self.lastSave = time.time()
+
+#Returns the name of the job, the range and [index, frames, location] of every written series
+def runTask(task):
+    job, start, stop = task
+    series = getJobSeries(job)
+    config = job.config
+    sink = getSink(job, start)
+    written = []
+    try:
+        for index in range(start, stop):
+            seedSeries(job.seed, index)
+            series.setSeriesLength(random.randint(config.MINFRAMES, config.MAXFRAMES))
+            series.getSeries()
+            sink.writeSeries(series, index)
+            written.append([index, series.seriesLength, sink.getLocation(index)])
+    except BaseException:
+        sink.abort()    #the task isn't completed, nothing of it is published
+        raise
+    sink.close()
+    return job.name, start, stop, written
+
+#All jobs run at the same time, every job in its own pool with job.workers processes.
+#Only the parent process writes the checkpoints, the workers just return their finished tasks.
+def runJobs(jobs):
+    start = time.time()
+    pools, checkpoints, results = [], [], []
+    try:
+        for job in jobs:
+            completed = loadCheckpoint(job)
+            tasks = getTasks(job, completed)
+            if(len(completed) > 0):
+                print("%s: resumed, %d tasks done, %d left" % (job.name, len(completed), len(tasks)))
+            pool = Pool(job.workers)
+            pools.append(pool)
+            checkpoints.append(Checkpoint(job, completed))
+            results.append([pool.apply_async(runTask, (task,), callback=checkpoints[-1].addTask) for task in tasks])
+        for i in range(len(jobs)):
+            for result in results[i]:
+                result.get()
+            checkpoints[i].save()
+            print("%s: %d series in %.1f s" % (jobs[i].name, checkpoints[i].done, time.time()-start))
+    except BaseException:    #e.g. an error in a worker, the other jobs are stopped too
+        for pool in pools:
+            pool.terminate()
+        for checkpoint in checkpoints:  #keeps everything which is finished
+            checkpoint.save()
+        raise
+    for pool in pools:
+        pool.close()
+        pool.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the generation jobs of a job spec")
+    parser.add_argument("spec", help="json file with one job or {\"jobs\": [...]}")
+    args = parser.parse_args()
+    runJobs(loadJobs(args.spec))
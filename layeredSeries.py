@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#Container for the frames of one series, which uses that consecutive frames mostly show the same background. The
+#per pixel median of all frames (the background, if the objects don't stay on the same pixels) is stored once, every
+#frame only stores the tiles (tileSize x tileSize pixels) which differ from it. Lossless, any frame is decoded from the
+#base and its own tiles, no other frame is needed:
+#   writeLayered("series.lseq", frames)      #list or array of (height, width, channels) uint8 frames
+#   series = openLayered("series.lseq")      #memory mapped
+#   frame = series[5]; frames = series.getFrames()
+#Layout (little endian): header, base, one chunk per frame, index, footer. Base and chunks are zlib compressed, a chunk
+#holds the numbers of the changed tiles (uint32, row by row) followed by their pixels. The index holds offset, length and
+#number of tiles of every chunk, the footer the offset and length of the base and the offset of the index.
+#The tiles of the right and bottom border are padded, the padding is cut off when decoding.
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+
+MAGIC = b"LSEQ"
+ENDING = ".lseq"
+VERSION = 1
+HEADER = struct.Struct("<4sBIIIBH")     #magic, version, frames, height, width, channels, tileSize
+FOOTER = struct.Struct("<QQQ4s")        #offset and length of the base, offset of the index, magic
+TILESIZE = 16
+COMPRESSLEVEL = 1   #zlib level, 1 is several times faster than the level 6 of png and only a bit larger
+
+def getTiles(img, tileSize):    #view (tilesY, tilesX, tileSize, tileSize, channels) of a padded image
+    h, w, c = img.shape
+    return img.reshape(h//tileSize, tileSize, w//tileSize, tileSize, c).swapaxes(1, 2)
+
+def getPadded(frames, tileSize):    #(frames, height, width, channels) padded to a multiple of tileSize
+    padY, padX = -frames.shape[1] % tileSize, -frames.shape[2] % tileSize
+    if(padY == 0 and padX == 0):
+        return frames
+    return np.pad(frames, ((0, 0), (0, padY), (0, padX), (0, 0)), mode='edge')
+
+#Returns the container as bytes. All frames need the same size, PIL images are converted
+def encodeLayered(frames, tileSize=TILESIZE, level=COMPRESSLEVEL):
+    frames = np.stack([np.asarray(frame, dtype=np.uint8) for frame in frames])
+    count, h, w, c = frames.shape
+    padded = getPadded(frames, tileSize)
+    base = np.partition(padded, count//2, axis=0)[count//2]    #median, one of the values of the pixel
+    #changed[f, y, x]: tile (y, x) of frame f differs from the base
+    tilesY, tilesX = padded.shape[1]//tileSize, padded.shape[2]//tileSize
+    changed = np.any(padded != base, axis=3).reshape(count, tilesY, tileSize, tilesX, tileSize).any(axis=(2, 4))
+    chunks = [HEADER.pack(MAGIC, VERSION, count, h, w, c, tileSize)]
+    offset = len(chunks[0])
+    baseChunk = zlib.compress(base[:h, :w].tobytes(), level)
+    baseOffset = offset
+    chunks.append(baseChunk)
+    offset += len(baseChunk)
+    index = np.zeros((count, 3), dtype='<u8')
+    for f in range(count):
+        numbers = np.flatnonzero(changed[f]).astype('<u4')
+        tiles = getTiles(padded[f], tileSize)[changed[f]]
+        chunk = zlib.compress(numbers.tobytes()+tiles.tobytes(), level)
+        index[f] = (offset, len(chunk), len(numbers))
+        chunks.append(chunk)
+        offset += len(chunk)
+    chunks.append(index.tobytes())
+    chunks.append(FOOTER.pack(baseOffset, len(baseChunk), offset, MAGIC))
+    return b"".join(chunks)
+
+#Written under a temporary name and renamed, so the file is never seen half written
+def writeLayered(file, frames, tileSize=TILESIZE, level=COMPRESSLEVEL):
+    data = encodeLayered(frames, tileSize, level)
+    tmpFile = file+".%d.tmp" % os.getpid()
+    with open(tmpFile, 'wb') as f:
+        f.write(data)
+    os.replace(tmpFile, file)
+    return len(data)
+
+def openLayered(file):
+    with open(file, 'rb') as f:
+        return LayeredSeries(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+#Decoder of a container (bytes, memoryview or mmap). The base is decompressed with the first frame and kept
+class LayeredSeries():
+    def __init__(self, data):
+        self.data = data
+        magic, version, self.frames, self.height, self.width, self.channels, self.tileSize = HEADER.unpack_from(data, 0)
+        baseOffset, baseLength, indexOffset, footerMagic = FOOTER.unpack_from(data, len(data)-FOOTER.size)
+        if(magic != MAGIC or footerMagic != MAGIC):
+            raise ValueError("not a layered series")
+        if(version != VERSION):
+            raise ValueError("unknown version of the layered series: %d" % version)
+        self.baseRange = (baseOffset, baseOffset+baseLength)
+        self.index = np.frombuffer(data[indexOffset:indexOffset+self.frames*24], dtype='<u8').reshape(self.frames, 3)
+        self.base = None
+
+    def getBase(self):  #padded like the frames when they were encoded
+        if(self.base is None):
+            base = np.frombuffer(zlib.decompress(self.data[self.baseRange[0]:self.baseRange[1]]), dtype=np.uint8)
+            base = base.reshape(self.height, self.width, self.channels)[None]
+            self.base = getPadded(base, self.tileSize)[0]
+        return self.base
+
+    def __len__(self):
+        return self.frames
+
+    #(height, width, channels) uint8 array, a new array for every call
+    def getFrame(self, frame):
+        if(frame < 0):
+            frame += self.frames
+        if(not 0 <= frame < self.frames):
+            raise IndexError("frame index out of range")
+        offset, length, count = (int(value) for value in self.index[frame])
+        img = self.getBase().copy()
+        if(count > 0):
+            raw = zlib.decompress(self.data[offset:offset+length])
+            numbers = np.frombuffer(raw, dtype='<u4', count=count)
+            tiles = np.frombuffer(raw, dtype=np.uint8, offset=4*count).reshape(count, self.tileSize, self.tileSize, self.channels)
+            tilesY, tilesX = divmod(numbers, img.shape[1]//self.tileSize)
+            getTiles(img, self.tileSize)[tilesY, tilesX] = tiles
+        return img[:self.height, :self.width]
+
+    def __getitem__(self, frame):
+        return self.getFrame(frame)
+
+    def getFrames(self):    #(frames, height, width, channels) array
+        return np.stack([self.getFrame(frame) for frame in range(self.frames)])
+
+    def __str__(self):
+        print("Frames: ", self.frames, " size: ", (self.width, self.height), " channels: ", self.channels)
+        print("Changed tiles per frame: ", self.index[:, 2].tolist(), " of ", -(-self.height//self.tileSize)*-(-self.width//self.tileSize))
+        return ""
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+#Spreads the jobs of a job spec (see jobRunner) over several machines. The machines only need a shared folder:
+#the output folder of every job gets a lease folder with the task list (ranges of series indices) and one lease file
+#per running task. A worker takes a task by creating its lease file, renews the lease while the task runs and writes
+#a done file with the manifest of the task at the end. Leases which weren't renewed for LEASETIMEOUT seconds
+#(e.g. the machine died) are taken over by the next worker.
+#   python leaseCoordinator.py init jobs.json           creates the task lists (optional, every worker does it too)
+#   python leaseCoordinator.py worker jobs.json         on every machine, runs until all tasks are done
+#   python leaseCoordinator.py local jobs.json -n 4     starts 4 local worker processes
+#   python leaseCoordinator.py status jobs.json
+#   python leaseCoordinator.py merge jobs.json          merges the done files to manifest.json
+#A lease file is named lease-<start>-<generation>. Taking over an expired lease creates the next generation with
+#O_EXCL, so only one worker can win. The loser of a lease may still finish its task, this only writes the same
+#series again, because every series is seeded with its index.
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from multiprocessing import Process
+import jobRunner
+from outputSink import getTmpName
+
+LEASEFOLDERNAME = "leases"
+TASKFILENAME = "tasks.json"
+MANIFESTFILENAME = "manifest.json"
+LEASETIMEOUT = 120      #seconds without renewal until a lease can be taken over
+POLLINTERVAL = 2        #seconds to wait if all open tasks are leased by other workers
+
+def getWorkerId():
+    return "%s-%d" % (socket.gethostname(), os.getpid())
+
+def getLeaseFolder(job):
+    return dict(job.sink)['folder']+"/"+LEASEFOLDERNAME
+
+def writeJson(file, data):  #atomic, the file is always complete
+    tmpFile = getTmpName(file)
+    with open(tmpFile, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmpFile, file)
+
+#Creates the task list of the job. If it exists, it has to belong to the same job
+def initLeases(job):
+    folder = getLeaseFolder(job)
+    os.makedirs(folder, exist_ok=True)
+    if(not os.path.exists(folder+"/"+TASKFILENAME)):
+        tasks = [[start, stop] for task, start, stop in jobRunner.getTasks(job)]
+        writeJson(folder+"/"+TASKFILENAME, {'key': jobRunner.getJobKey(job), 'name': job.name, 'tasks': tasks})
+    return loadTasks(job)
+
+def loadTasks(job):
+    file = getLeaseFolder(job)+"/"+TASKFILENAME
+    with open(file, 'r') as f:
+        data = json.load(f)
+    if(data['key'] != jobRunner.getJobKey(job)):
+        raise ValueError("the task list "+file+" belongs to another job config. Delete the lease folder or use another output folder")
+    return [tuple(task) for task in data['tasks']]
+
+def getDoneFile(job, task):
+    return getLeaseFolder(job)+"/done-%d-%d.json" % task
+
+#The lease folder holds the lease and done files of all tasks, so it is listed once per pass over the tasks
+#and the listing (names) is passed to isDone and getLeaseFiles. Without names they look at the folder themselves
+def listLeaseFolder(job):
+    return set(os.listdir(getLeaseFolder(job)))
+
+def isDone(job, task, names=None):
+    if(names is not None):
+        return os.path.basename(getDoneFile(job, task)) in names
+    return os.path.exists(getDoneFile(job, task))
+
+def getLeaseFiles(job, task, names=None):   #generation -> filename of all leases of the task
+    prefix = "lease-%d-" % task[0]
+    leases = {}
+    for name in listLeaseFolder(job) if names is None else names:
+        if(name.startswith(prefix) and name[len(prefix):].isdigit()):
+            leases[int(name[len(prefix):])] = getLeaseFolder(job)+"/"+name
+    return leases
+
+class Lease():
+    def __init__(self, file, workerId):
+        self.file = file
+        self.workerId = workerId
+        self.stopped = threading.Event()
+        self.thread = None
+
+    #Renews the lease (mtime of the file) until stop is called
+    def start(self):
+        def renew():
+            while(not self.stopped.wait(LEASETIMEOUT/4.)):
+                try:
+                    os.utime(self.file, None)
+                except OSError:     #already removed, e.g. the task was finished by another worker
+                    pass
+        self.thread = threading.Thread(target=renew)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if(self.thread is not None):
+            self.thread.join()
+
+#Returns a Lease or None if the task is leased by another worker. names can be an older listing of the lease folder,
+#creating the lease with O_EXCL and the check of the done file afterwards don't depend on it
+def acquireLease(job, task, workerId, names=None):
+    leases = getLeaseFiles(job, task, names)
+    generation = 0
+    if(len(leases) > 0):
+        generation = max(leases)
+        try:
+            if(time.time()-os.path.getmtime(leases[generation]) < LEASETIMEOUT):
+                return None
+        except OSError:     #removed in the meantime, the task was just finished
+            return None
+        generation += 1     #expired, take it over
+    file = getLeaseFolder(job)+"/lease-%d-%d" % (task[0], generation)
+    try:
+        fd = os.open(file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:     #another worker was faster
+        return None
+    with os.fdopen(fd, 'w') as f:
+        f.write(workerId)
+    if(isDone(job, task)):  #finished by another worker since the check in runWorker
+        os.remove(file)
+        return None
+    return Lease(file, workerId)
+
+#The lease is released when the task fails too, so another worker can take it without waiting for LEASETIMEOUT
+def runLeasedTask(job, task, lease):
+    lease.start()
+    try:
+        name, start, stop, series = jobRunner.runTask((job, task[0], task[1]))
+        writeJson(getDoneFile(job, task), {'worker': lease.workerId, 'start': start, 'stop': stop, 'series': series})
+    finally:
+        lease.stop()
+        for file in getLeaseFiles(job, task).values():
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+
+#Runs open tasks of all jobs until every task is done. Returns the number of tasks done by this worker.
+#A task which fails is not taken again by this worker, the other workers can still try it
+def runWorker(jobs, workerId=None):
+    workerId = getWorkerId() if workerId is None else workerId
+    tasks = [initLeases(job) for job in jobs]
+    done = 0
+    failed = set()
+    while(True):
+        pending = False
+        for i in range(len(jobs)):
+            names = listLeaseFolder(jobs[i])
+            for task in tasks[i]:
+                if(isDone(jobs[i], task, names) or (i, task) in failed):
+                    continue
+                pending = True
+                lease = acquireLease(jobs[i], task, workerId, names)
+                if(lease is not None):
+                    try:
+                        runLeasedTask(jobs[i], task, lease)
+                        done += 1
+                    except Exception as e:
+                        print("task %d-%d of %s failed: %s" % (task[0], task[1], jobs[i].name, e))
+                        failed.add((i, task))
+                    names = listLeaseFolder(jobs[i])    #the task took a while, the other workers went on
+        if(not pending):
+            return done
+        time.sleep(POLLINTERVAL)    #the remaining tasks are leased by other workers
+
+def getStatus(job):
+    tasks = loadTasks(job)
+    names = listLeaseFolder(job)
+    done = sum(1 for task in tasks if isDone(job, task, names))
+    leased = sum(1 for task in tasks if not isDone(job, task, names) and len(getLeaseFiles(job, task, names)) > 0)
+    return {'name': job.name, 'tasks': len(tasks), 'done': done, 'leased': leased, 'open': len(tasks)-done-leased}
+
+#Merges the done files of all tasks into one manifest in the output folder of the job. Returns the missing tasks
+def mergeManifests(job):
+    tasks = loadTasks(job)
+    series, workers, missing = [], {}, []
+    for task in tasks:
+        if(not isDone(job, task)):
+            missing.append(task)
+            continue
+        with open(getDoneFile(job, task), 'r') as f:
+            data = json.load(f)
+        series += data['series']
+        workers[data['worker']] = workers.get(data['worker'], 0)+data['stop']-data['start']
+    series.sort()
+    writeJson(dict(job.sink)['folder']+"/"+MANIFESTFILENAME, {'key': jobRunner.getJobKey(job), 'name': job.name, 'seed': job.seed,
+              'complete': len(missing) == 0, 'workers': workers, 'series': series})
+    return missing
+
+def runLocal(jobs, processes):  #several workers on this machine, e.g. for testing
+    for job in jobs:
+        initLeases(job)
+    workers = [Process(target=runWorker, args=(jobs,)) for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the jobs of a job spec on several workers with a shared lease folder")
+    parser.add_argument("command", choices=["init", "worker", "local", "status", "merge"])
+    parser.add_argument("spec", help="json file with one job or {\"jobs\": [...]}")
+    parser.add_argument("-n", "--processes", type=int, default=2, help="number of worker processes for local")
+    parser.add_argument("--worker", default=None, help="id of the worker (default: hostname-pid)")
+    args = parser.parse_args()
+    jobs = jobRunner.loadJobs(args.spec)
+    if(args.command == "init"):
+        for job in jobs:
+            print("%s: %d tasks" % (job.name, len(initLeases(job))))
+    elif(args.command == "worker"):
+        print("tasks done by this worker: %d" % runWorker(jobs, args.worker))
+    elif(args.command == "local"):
+        runLocal(jobs, args.processes)
+    if(args.command in ["worker", "local", "merge"]):
+        for job in jobs:
+            missing = mergeManifests(job)
+            print("%s: manifest written, %d tasks missing" % (job.name, len(missing)))
+    elif(args.command == "status"):
+        for job in jobs:
+            print("%(name)s: %(done)d/%(tasks)d tasks done, %(leased)d leased, %(open)d open" % getStatus(job))
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#Ground truth optical flow for the generated series.
+#Every object (and the background) is drawn with a known affine transformation, so the flow of a pixel
+#is given by mapping it back into the source image of the visible object and forward into the next frame.
+#The visible object of every pixel is stored in a label map while the frame is composited.
+import numpy as np
+import struct
+import zlib
+
+#Records the visible object for every pixel of the frame. Objects have to be pasted in compositing order,
+#so the last object with alpha > 0 at a pixel wins (same as Image.paste with the image as mask)
+def pasteLabel(labelMap, alpha, posX, posY, label):
+    alpha = alpha > 0
+    h, w = labelMap.shape
+    x0, y0 = max(posX, 0), max(posY, 0)
+    x1, y1 = min(posX+alpha.shape[1], w), min(posY+alpha.shape[0], h)
+    if(x0 >= x1 or y0 >= y1):   #object is not on the canvas
+        return labelMap
+    region = labelMap[y0:y1, x0:x1]
+    region[alpha[y0-posY:y1-posY, x0-posX:x1-posX]] = label
+    return labelMap
+
+#placement is stored by the renderer for every frame: (posX, posY, width, height, scaleX, scaleY, rotation)
+#width and height are the size of the rotated image, scaleX and scaleY the scale which was really applied after rounding
+#Returns the 3x3 matrix, which maps the coordinates in the source image (relative to its middle) to the canvas
+def getPlacementMatrix(placement):
+    posX, posY, w, h, sx, sy, r = placement
+    c = np.cos(r*np.pi/180.)
+    s = np.sin(r*np.pi/180.)
+    #PIL rotates counter clockwise, the y-axis of the image points downwards
+    return np.array([[ c*sx, s*sy, posX+w/2.],
+                     [-s*sx, c*sy, posY+h/2.],
+                     [   0.,   0.,        1.]])
+
+#Returns the flow from frame to frame+1 for a single pair of frames.
+#labelMap is the label map of the first frame (index of the visible object in the scene, -1 for no object)
+def getFlowFromLabels(labelMap, matrices):
+    h, w = labelMap.shape
+    #the last entry is the identity, so pixels without any object (label -1) don't move
+    mats = np.concatenate((matrices, np.eye(3)[None, :2]), axis=0)
+    m = mats[labelMap]    #shape (h, w, 2, 3)
+    x = np.arange(w, dtype=np.float64)+0.5  #middle of the pixel
+    y = np.arange(h, dtype=np.float64)[:, None]+0.5
+    flow = np.empty((h, w, 2), dtype=np.float32)
+    flow[..., 0] = m[..., 0, 0]*x + m[..., 0, 1]*y + m[..., 0, 2] - x
+    flow[..., 1] = m[..., 1, 0]*x + m[..., 1, 1]*y + m[..., 1, 2] - y
+    return flow
+
+#Returns the dense flow for every consecutive pair of frames. flow[frame] maps frame to frame+1, so the last entry is None.
+#labels has to contain the label map of every frame (see pasteLabel), the placements are read from scene.placements
+#(see finalImageSeries.Scene)
+def getOpticalFlow(scene, labels, frames):
+    flow = np.array([None]*frames)
+    for frame in range(frames-1):
+        matrices = np.empty((len(scene), 2, 3))
+        for i in range(len(scene)):
+            a = getPlacementMatrix(scene.placements[i, frame])
+            b = getPlacementMatrix(scene.placements[i, frame+1])
+            matrices[i] = b.dot(np.linalg.inv(a))[:2]
+        flow[frame] = getFlowFromLabels(labels[frame], matrices)
+    return flow
+
+#Test function for the flow: looks up every pixel of the first frame in the second frame.
+#Where the flow is correct and the pixel is not occluded, the returned image equals img1
+def applyFlowToImg(flow, img1, img2):
+    h, w = flow.shape[:2]
+    x = np.arange(w)[None, :] + np.rint(flow[..., 0]).astype(int)
+    y = np.arange(h)[:, None] + np.rint(flow[..., 1]).astype(int)
+    valid = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+    warped = np.zeros_like(img1)
+    warped[valid] = img2[y[valid], x[valid]]
+    return warped
+
+################## Flow files ##################
+#Middlebury .flo: magic float 202021.25, width and height as int32, then the flow (u,v) row by row as float32
+FLOMAGIC = 202021.25
+#16 bit png (same encoding as the KITTI flow files): R = u*64+2^15, G = v*64+2^15, B = 1 if the flow is valid
+FLOWPNGSCALE = 64.
+FLOWPNGOFFSET = 2**15
+
+def encodeFlo(flow):
+    h, w = flow.shape[:2]
+    header = np.array([FLOMAGIC], dtype='<f4').tobytes() + np.array([w, h], dtype='<i4').tobytes()
+    return header + np.ascontiguousarray(flow, dtype='<f4').tobytes()
+
+def writeFlo(path, flow):
+    with open(path, 'wb') as f:     #whole file in one write
+        f.write(encodeFlo(flow))
+
+def readFlo(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if(np.frombuffer(data, dtype='<f4', count=1)[0] != FLOMAGIC):
+        raise ValueError("not a .flo file: "+path)
+    w, h = np.frombuffer(data, dtype='<i4', count=2, offset=4)
+    return np.frombuffer(data, dtype='<f4', offset=12).reshape(h, w, 2).copy()
+
+def pngChunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag+data) & 0xffffffff)
+
+#PIL can't write 16 bit rgb images, so the png is assembled here. All rows are written with filter type 0
+def encodeFlowPng(flow, valid=None, compression=6):
+    h, w = flow.shape[:2]
+    img = np.empty((h, w, 3), dtype='>u2')
+    img[..., :2] = np.clip(np.rint(flow*FLOWPNGSCALE + FLOWPNGOFFSET), 0, 2**16-1)
+    img[..., 2] = 1 if valid is None else valid
+    rows = np.zeros((h, 1+w*6), dtype=np.uint8)    #first byte of every row is the filter type
+    rows[:, 1:] = img.view(np.uint8).reshape(h, w*6)
+    header = struct.pack('>IIBBBBB', w, h, 16, 2, 0, 0, 0)     #16 bit, truecolor, no interlace
+    return (b'\x89PNG\r\n\x1a\n' + pngChunk(b'IHDR', header)
+            + pngChunk(b'IDAT', zlib.compress(rows.tobytes(), compression)) + pngChunk(b'IEND', b''))
+
+def writeFlowPng(path, flow, valid=None):
+    with open(path, 'wb') as f:
+        f.write(encodeFlowPng(flow, valid))
+
+#Only reads the files written by encodeFlowPng (filter type 0). Returns the flow and the valid mask
+def readFlowPng(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    pos, idat = 8, []
+    while(pos < len(data)):
+        length, tag = struct.unpack('>I4s', data[pos:pos+8])
+        if(tag == b'IHDR'):
+            w, h = struct.unpack('>II', data[pos+8:pos+16])
+        elif(tag == b'IDAT'):
+            idat.append(data[pos+8:pos+8+length])
+        pos += 12+length
+    rows = np.frombuffer(zlib.decompress(b''.join(idat)), dtype=np.uint8).reshape(h, 1+w*6)
+    if(rows[:, 0].any()):
+        raise ValueError("only png files without row filters are supported: "+path)
+    img = rows[:, 1:].copy().view('>u2').reshape(h, w, 3).astype(np.float32)
+    return (img[..., :2]-FLOWPNGOFFSET)/FLOWPNGSCALE, img[..., 2] > 0
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#Output sinks for finished series. A sink gets the ImageSeries after the frames are created and writes
+#the frames and (if computed) the optical flow. All filenames follow getFilename, so a series in a shard
+#has the same names as a series written to a folder.
+#Series folders and shards are written under a temporary name and renamed when they are complete. If a run is
+#stopped and started again, an unfinished series or shard is written again and never shows up half written.
+#The temporary names contain host and process, so several workers can write the same series at the same time.
+#Temporary files of stopped processes are removed before a series or shard is written (see removeStaleTmp).
+import glob
+import io
+import os
+import shutil
+import socket
+import tarfile
+import time
+import layeredSeries
+import opticalFlow
+from finalImageSeries import getFilename, encodePng, SERIESFOLDER, SERIESNAME
+
+STALETMPAGE = 3600     #seconds, temporary files of other hosts are removed if they weren't changed for this long
+
+def getTmpName(name):
+    return "%s.%s-%d.tmp" % (name, socket.gethostname(), os.getpid())
+
+def isRunning(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:     #running, but belongs to another user
+        pass
+    return True
+
+#Removes the temporary files and folders of name (see getTmpName) which were left by a stopped run. The ones of
+#running processes on this host are kept, they could write the same series right now
+def removeStaleTmp(name):
+    host = socket.gethostname()
+    for tmp in glob.glob(glob.escape(name)+".*.tmp"):
+        tmpHost, _, pid = tmp[len(name)+1:-len(".tmp")].rpartition("-")
+        try:
+            if(tmpHost == host):
+                if(int(pid) != os.getpid() and isRunning(int(pid))):
+                    continue
+            elif(time.time()-os.path.getmtime(tmp) < STALETMPAGE):
+                continue
+            if(os.path.isdir(tmp)):
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                os.remove(tmp)
+        except (OSError, ValueError):   #removed by another process or not a name of getTmpName
+            pass
+
+def getSeriesKey(index):    #every series gets its own subfolder (or prefix in a shard)
+    return "%08d" % index
+
+#Returns (filename, bytes) for every file of the series
+def getSeriesFiles(series, folder, name):
+    files = []
+    for i in range(len(series.output)):
+        files.append((getFilename(folder, name, series.seriesLength, i), encodePng(series.output[i])))
+    for i in range(len(series.imageFlow)):
+        if(series.imageFlow[i] is not None):    #the last frame has no successor
+            files.append((getFilename(folder, name+"Flow", series.seriesLength, i, ".flo"), opticalFlow.encodeFlo(series.imageFlow[i])))
+            files.append((getFilename(folder, name+"Flow", series.seriesLength, i, ".png"), opticalFlow.encodeFlowPng(series.imageFlow[i])))
+    return files
+
+class FolderSink():
+    def __init__(self, folder=SERIESFOLDER, name=SERIESNAME):
+        self.folder = folder
+        self.name = name
+
+    def writeSeries(self, series, index):
+        self.writeFolder(series, index, True)
+
+    def writeFolder(self, series, index, images):
+        folder = self.folder+"/"+getSeriesKey(index)
+        tmpFolder = getTmpName(folder)
+        removeStaleTmp(folder)     #left over from a stopped run
+        os.makedirs(tmpFolder)
+        if(images):
+            series.saveImages(tmpFolder, self.name)
+        if(any(flow is not None for flow in series.imageFlow)):
+            series.saveFlow(tmpFolder, self.name)
+        if(os.path.exists(folder)):    #the series is written again, e.g. after a restart
+            shutil.rmtree(folder, ignore_errors=True)
+        try:
+            os.rename(tmpFolder, folder)
+        except OSError:     #another worker just wrote the same series
+            shutil.rmtree(tmpFolder)
+
+    def getLocation(self, index):   #where the series is stored, relative to the folder of the sink
+        return getSeriesKey(index)
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+#Writes every series as one layered container <seriesKey>.lseq (see layeredSeries): the background is stored once and
+#every frame only with the tiles which differ from it. The flow (if computed) is written like FolderSink into <seriesKey>/
+class LayeredSink(FolderSink):
+    def __init__(self, folder=SERIESFOLDER, name=SERIESNAME):
+        FolderSink.__init__(self, folder, name)
+        if(not os.path.exists(folder)):
+            os.makedirs(folder, exist_ok=True)    #several processes can create the sink at the same time
+
+    def writeSeries(self, series, index):
+        file = self.folder+"/"+self.getLocation(index)
+        with series.stats.timer("encode"):
+            data = layeredSeries.encodeLayered(series.output)
+        removeStaleTmp(file)
+        with series.stats.timer("write"):
+            with open(getTmpName(file), 'wb') as f:
+                f.write(data)
+            os.replace(getTmpName(file), file)  #the series is written again, e.g. after a restart
+        if(any(flow is not None for flow in series.imageFlow)):
+            self.writeFolder(series, index, False)
+
+    def getLocation(self, index):
+        return getSeriesKey(index)+layeredSeries.ENDING
+
+#Packs many series into tar files. Every shard contains seriesPerShard series, the files of a series are
+#stored as <seriesKey>/<filename>. The whole series is encoded in memory and appended in one go.
+#Several sinks can write into the same folder, if each starts at another shard (firstShard).
+class ShardSink():
+    def __init__(self, folder=SERIESFOLDER, name=SERIESNAME, seriesPerShard=1000, shardName="shard", firstShard=0):
+        self.folder = folder
+        self.name = name
+        self.seriesPerShard = seriesPerShard
+        self.shardName = shardName
+        self.shardIndex = firstShard-1
+        self.seriesInShard = 0
+        self.tar = None
+        if(not os.path.exists(folder)):
+            os.makedirs(folder, exist_ok=True)    #several processes can create the sink at the same time
+
+    def getShardFilename(self, shardIndex):
+        return self.folder+"/"+self.shardName+"-%06d.tar" % shardIndex
+
+    def nextShard(self):
+        self.close()
+        self.shardIndex += 1
+        self.seriesInShard = 0
+        removeStaleTmp(self.getShardFilename(self.shardIndex))
+        self.tar = tarfile.open(getTmpName(self.getShardFilename(self.shardIndex)), 'w')
+
+    def writeSeries(self, series, index):
+        if(self.tar is None or self.seriesInShard >= self.seriesPerShard):
+            self.nextShard()
+        now = time.time()
+        with series.stats.timer("encode"):
+            files = getSeriesFiles(series, getSeriesKey(index), self.name)
+        with series.stats.timer("write"):
+            for filename, data in files:
+                info = tarfile.TarInfo(filename)
+                info.size = len(data)
+                info.mtime = now
+                self.tar.addfile(info, io.BytesIO(data))
+        self.seriesInShard += 1
+
+    def getLocation(self, index):   #only valid for the series of the current shard
+        return os.path.basename(self.getShardFilename(self.shardIndex))+"/"+getSeriesKey(index)
+
+    def close(self):
+        if(self.tar is not None):
+            self.tar.close()
+            os.replace(getTmpName(self.getShardFilename(self.shardIndex)), self.getShardFilename(self.shardIndex))
+            self.tar = None
+
+    def abort(self):    #closes without renaming, the unfinished shard stays a .tmp file
+        if(self.tar is not None):
+            self.tar.close()
+            self.tar = None
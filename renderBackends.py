@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+#Rendering backends of the generator. Scene and trajectories don't depend on the backend, every image
+#operation of ImageSeries goes through one of the classes below. All backends have the same methods:
+#   fromPIL(img)              converts a loaded PIL image to the image type of the backend (RGBA)
+#   fromArray(arr)            same for a (height, width, 4) uint8 array, e.g. a window of a stored background
+#   fromAtlas(atlas, key, l)  level l of a sprite of the atlas (see spriteAtlas), without copying its pixels
+#   loadImage(file)           loads a file as RGBA
+#   crop(img, box)            box = (left, top, right, bottom). Parts outside of the image are transparent
+#   transform(img, w, h, r)   resizes to (w, h) and rotates r degree counter clockwise.
+#                             The image grows with the rotation like PIL rotate(expand=1), the size is getRotatedSize
+#   newCanvas(w, h)           transparent canvas
+#   paste(canvas, img, x, y)  blends img with its alpha onto the canvas at (x, y) and returns the canvas
+#   getAlpha(img)             alpha channel as (height, width) array
+#   toArray(img)              (height, width, 4) uint8 array
+#   premultiply(img)          transformed sprite for PREMULTIPLIEDSPRITES, only pasted afterwards. The NumPy backends
+#                             return a PremultipliedSprite, PIL the image itself
+#Select the backend with getBackend("pil"), getBackend("numpy"), getBackend("skimage") or getBackend("numba").
+#numba is the NumPy backend with the compiled kernels of fastKernels, it falls back to the NumPy backend without numba.
+from PIL import Image
+import numpy as np
+import math
+
+BACKENDS = ["pil", "numpy", "skimage", "numba"]
+
+def getBackend(name):
+    if(name == "pil"):
+        return PILBackend()
+    elif(name == "numpy"):
+        return NumpyBackend()
+    elif(name == "skimage"):
+        return SKImageBackend()     #scikit-image is only imported if this backend is used
+    elif(name == "numba"):
+        import fastKernels  #numba is only imported if this backend is used
+        if(not fastKernels.AVAILABLE):
+            print("numba is not installed, using the numpy backend")
+            return NumpyBackend()
+        return NumbaBackend()
+    raise ValueError("unknown backend: "+str(name)+" (possible: "+", ".join(BACKENDS)+")")
+
+def getSize(img):   #(width, height) of a PIL image or an array
+    if(isinstance(img, np.ndarray)):
+        return img.shape[1], img.shape[0]
+    return img.size
+
+#Same calculation as PIL rotate with expand=1, so all backends place the objects at the same position
+def getRotatedSize(w, h, r):
+    r = r % 360.
+    if(r == 0 or r == 180):
+        return w, h
+    if(r == 90 or r == 270):
+        return h, w
+    angle = -math.radians(r)
+    a, b = round(math.cos(angle), 15), round(math.sin(angle), 15)
+    c = a*(-w/2.) + b*(-h/2.) + w/2.    #rotation around the middle of the image
+    f = -b*(-w/2.) + a*(-h/2.) + h/2.
+    xx = [a*x + b*y + c for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+    yy = [-b*x + a*y + f for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+    return math.ceil(max(xx)) - math.floor(min(xx)), math.ceil(max(yy)) - math.floor(min(yy))
+
+#Returns the 3x3 matrix which maps the pixel coordinates of the transformed image to the pixel coordinates of img.
+#Pixel coordinates are the indices, so the middle of the first pixel is (0, 0)
+def getInverseMatrix(srcW, srcH, w, h, r):
+    nw, nh = getRotatedSize(w, h, r)
+    c = math.cos(math.radians(r))
+    s = math.sin(math.radians(r))
+    toCenter = np.array([[1., 0., 0.5-nw/2.], [0., 1., 0.5-nh/2.], [0., 0., 1.]])
+    rotate = np.array([[c, -s, w/2.], [s, c, h/2.], [0., 0., 1.]])   #inverse of the counter clockwise rotation
+    scale = np.array([[srcW/float(w), 0., -0.5], [0., srcH/float(h), -0.5], [0., 0., 1.]])
+    return scale.dot(rotate).dot(toCenter), (nw, nh)
+
+class PILBackend():
+    name = "pil"
+
+    def fromPIL(self, img):
+        return img.convert('RGBA') if img.mode != 'RGBA' else img
+
+    def fromArray(self, arr):
+        return Image.fromarray(np.ascontiguousarray(arr), 'RGBA')
+
+    def fromAtlas(self, atlas, key, level):
+        return atlas.getImage(key, level)
+
+    def loadImage(self, file):
+        return Image.open(file).convert('RGBA')
+
+    def crop(self, img, box):
+        return img.crop(box)
+
+    def transform(self, img, w, h, r):
+        return img.resize((w,h)).rotate(r, expand=1)   #scale first. If rotated, the size of the image is resized due expand=1!
+
+    def newCanvas(self, w, h):
+        return Image.new("RGBA", (w,h))
+
+    def paste(self, canvas, img, x, y):
+        canvas.paste(img, (x,y), img)
+        return canvas
+
+    def getAlpha(self, img):
+        return np.asarray(img.getchannel('A'))
+
+    def toArray(self, img):
+        return np.array(img)
+
+    def premultiply(self, img):     #PIL blends straight alpha
+        return img
+
+#Transformed sprite of the NumPy backends in premultiplied form (see PREMULTIPLIEDSPRITES). The loaded sprites stay
+#straight, only the output of transform is premultiplied, once, before it goes into the sprite cache:
+#   blend    (height, width, 4) uint16, colours and alpha multiplied with alpha plus the rounding of paste
+#   inverse  (height, width, 1) uint8, 255-alpha
+#so paste is one multiply-add per channel in uint16 (at most 255*255+255*255+128+254, no overflow). Same output as straight
+class PremultipliedSprite():
+    def __init__(self, straight):
+        alpha = straight[:, :, 3:4]
+        self.size = (straight.shape[1], straight.shape[0])     #see getSize
+        self.blend = np.multiply(straight, alpha, dtype=np.uint16)
+        self.blend += 128
+        self.inverse = 255-alpha
+
+    def getAlpha(self):
+        return 255-self.inverse[:, :, 0]
+
+#Images are (height, width, 4) uint8 arrays. Sprites are warped in one step (scale and rotation) with bilinear
+#interpolation on premultiplied colours. Blending uses the same integer arithmetic as PIL paste.
+class NumpyBackend():
+    name = "numpy"
+
+    def fromPIL(self, img):
+        return np.array(img.convert('RGBA'))
+
+    def fromArray(self, arr):
+        return arr  #the images are never written, so views are fine
+
+    def fromAtlas(self, atlas, key, level):
+        return atlas.getSprite(key, level)
+
+    def loadImage(self, file):
+        return self.fromPIL(Image.open(file))
+
+    def crop(self, img, box):
+        left, top, right, bottom = box
+        out = np.zeros((bottom-top, right-left, 4), dtype=np.uint8)
+        h, w = img.shape[:2]
+        x0, y0, x1, y1 = max(left, 0), max(top, 0), min(right, w), min(bottom, h)
+        if(x0 < x1 and y0 < y1):
+            out[y0-top:y1-top, x0-left:x1-left] = img[y0:y1, x0:x1]
+        return out
+
+    def transform(self, img, w, h, r):
+        if((w, h) == getSize(img) and r % 360. == 0):   #e.g. the background
+            return img
+        matrix, (nw, nh) = getInverseMatrix(getSize(img)[0], getSize(img)[1], w, h, r)
+        x = np.arange(nw, dtype=np.float32)
+        y = np.arange(nh, dtype=np.float32)[:, None]
+        srcX = matrix[0, 0]*x + matrix[0, 1]*y + matrix[0, 2]
+        srcY = matrix[1, 0]*x + matrix[1, 1]*y + matrix[1, 2]
+        return sampleBilinear(getPaddedPremultiplied(img), srcX, srcY)
+
+    def newCanvas(self, w, h):
+        return np.zeros((h, w, 4), dtype=np.uint8)
+
+    def paste(self, canvas, img, x, y):
+        h, w = canvas.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x+getSize(img)[0], w), min(y+getSize(img)[1], h)
+        if(x0 >= x1 or y0 >= y1):   #not on the canvas
+            return canvas
+        dst = canvas[y0:y1, x0:x1]
+        if(isinstance(img, PremultipliedSprite)):    #in place in one uint16 array
+            tmp = np.multiply(dst, img.inverse[y0-y:y1-y, x0-x:x1-x], dtype=np.uint16)
+            tmp += img.blend[y0-y:y1-y, x0-x:x1-x]
+            tmp += tmp >> 8
+            tmp >>= 8
+            dst[...] = tmp
+            return canvas
+        src = img[y0-y:y1-y, x0-x:x1-x].astype(np.int32)
+        alpha = src[:, :, 3:4]
+        tmp = dst*(255-alpha) + src*alpha + 128     #same rounding as PIL
+        dst[...] = (tmp + (tmp >> 8)) >> 8
+        return canvas
+
+    def getAlpha(self, img):
+        if(isinstance(img, PremultipliedSprite)):
+            return img.getAlpha()
+        return img[:, :, 3]
+
+    def toArray(self, img):
+        return img
+
+    def premultiply(self, img):
+        return img if isinstance(img, PremultipliedSprite) else PremultipliedSprite(img)
+
+#The colours are premultiplied with alpha before interpolating, so transparent pixels don't darken the edges.
+#The border of one transparent pixel is sampled for everything outside of the image
+def getPaddedPremultiplied(img):
+    h, w = img.shape[:2]
+    padded = np.zeros((h+2, w+2, 4), dtype=np.float32)
+    padded[1:-1, 1:-1, 3] = img[:, :, 3]
+    padded[1:-1, 1:-1, :3] = img[:, :, :3]*(img[:, :, 3:4]/np.float32(255.))
+    return padded
+
+#Bilinear sampling of the padded image (see getPaddedPremultiplied) at the (float) pixel coordinates srcX, srcY
+def sampleBilinear(padded, srcX, srcY):
+    h, w = padded.shape[0]-2, padded.shape[1]-2
+    x0 = np.floor(srcX)
+    y0 = np.floor(srcY)
+    fx = (srcX-x0)[..., None]
+    fy = (srcY-y0)[..., None]
+    #indices into the padded image, everything outside points to the transparent border
+    x0 = x0.astype(np.int64)+1
+    y0 = y0.astype(np.int64)+1
+    x1 = np.clip(x0+1, 0, w+1)
+    y1 = np.clip(y0+1, 0, h+1)
+    x0 = np.clip(x0, 0, w+1)
+    y0 = np.clip(y0, 0, h+1)
+    out = (padded[y0, x0]*(1-fx) + padded[y0, x1]*fx)*(1-fy) + (padded[y1, x0]*(1-fx) + padded[y1, x1]*fx)*fy
+    return unpremultiply(out)
+
+def unpremultiply(img):
+    alpha = img[:, :, 3:4]
+    out = np.empty(img.shape, dtype=np.uint8)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[:, :, :3] = np.clip(np.where(alpha > 0, img[:, :, :3]*255./alpha, 0)+0.5, 0, 255)
+    out[:, :, 3:] = np.clip(alpha+0.5, 0, 255)
+    return out
+
+#Same images and output as the NumPy backend. Warping and pasting are compiled kernels (see fastKernels), which
+#don't need the temporary arrays of the NumPy code
+class NumbaBackend(NumpyBackend):
+    name = "numba"
+
+    def __init__(self):
+        import fastKernels
+        self.kernels = fastKernels
+
+    def transform(self, img, w, h, r):
+        if((w, h) == getSize(img) and r % 360. == 0):
+            return img
+        matrix, (nw, nh) = getInverseMatrix(getSize(img)[0], getSize(img)[1], w, h, r)
+        return self.kernels.warpBilinear(getPaddedPremultiplied(img), matrix, nw, nh)
+
+    def paste(self, canvas, img, x, y):
+        if(isinstance(img, PremultipliedSprite)):
+            return self.kernels.pastePremultiplied(canvas, img.blend, img.inverse, x, y)
+        return self.kernels.pasteStraight(canvas, img, x, y)
+
+#Same image type as the NumPy backend, but loading and warping are done with scikit-image
+class SKImageBackend(NumpyBackend):
+    name = "skimage"
+
+    def __init__(self):
+        from skimage import io, transform   #only imported if the backend is really used
+        self.io = io
+        self.skTransform = transform
+
+    def loadImage(self, file):
+        img = self.io.imread(file)
+        if(img.ndim == 2):  #grayscale
+            img = np.stack((img,)*3, axis=2)
+        if(img.shape[2] == 3):
+            img = np.concatenate((img, np.full(img.shape[:2]+(1,), 255, dtype=img.dtype)), axis=2)
+        return img.astype(np.uint8)
+
+    def transform(self, img, w, h, r):
+        if((w, h) == getSize(img) and r % 360. == 0):
+            return img
+        matrix, (nw, nh) = getInverseMatrix(getSize(img)[0], getSize(img)[1], w, h, r)
+        premultiplied = img.astype(np.float32)
+        premultiplied[:, :, :3] *= premultiplied[:, :, 3:4]/255.
+        out = self.skTransform.warp(premultiplied, self.skTransform.AffineTransform(matrix=matrix), output_shape=(nh, nw),
+                                    order=1, mode='constant', cval=0, preserve_range=True)
+        return unpremultiply(out)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+#Shared memory ring buffer between generator processes and a training process. The buffer has a fixed number of
+#slots, every slot holds one series as (frames, height, width, channels) uint8 array and some metadata (index of the
+#series in the job, number of frames). No files and no image codecs are involved.
+#   buffer = RingBuffer.forJob(job, slots=16)        #job from jobRunner.getJob / loadJobs
+#   producers = startProducers(buffer, job)
+#   with buffer.get() as slot:                       #blocks until a series is ready
+#       train(slot.frames)                           #view into the shared memory, only valid inside the with block
+#   buffer.close(); joinProducers(producers); buffer.shutdown()
+#Slots go FREE -> WRITING (producer) -> READY -> READING (consumer) -> FREE. Consumers get the ready slots in the order
+#in which they were finished. After close (or when all producers are done) the ready slots can still be read, then get
+#raises BufferClosed. If a producer stops with an error, the buffer is closed and get raises ProducerFailed with the
+#traceback of the producer instead.
+import queue
+import random
+import traceback
+import numpy as np
+from multiprocessing import shared_memory, Condition, Process
+import jobRunner
+
+FREE, WRITING, READY, READING = 0, 1, 2, 3
+HEADERFIELDS = ["closed", "sequence", "producers", "failed"]     #failed: number of the first failed producer+1
+SLOTFIELDS = ["state", "sequence", "index", "frames", "producer"]
+ERRORSIZE = 4096    #bytes for the error message of the first failed producer
+
+class BufferClosed(Exception):
+    pass
+
+class ProducerFailed(Exception):
+    pass
+
+class RingBuffer():
+    def __init__(self, slots, frames, height, width, channels=4):
+        self.shape = (slots, frames, height, width, channels)
+        self.condition = Condition()
+        dataSize = getAligned(int(np.prod(self.shape)))
+        self.memory = shared_memory.SharedMemory(create=True, size=dataSize+8*(len(HEADERFIELDS)+slots*len(SLOTFIELDS))+ERRORSIZE)
+        self.owner = True
+        self.attach()
+        self.header[:] = 0
+        self.slots[:] = 0
+        self.error[:] = 0
+
+    @staticmethod
+    def forJob(job, slots=16, channels=4):    #slots for the largest series of the job
+        config = job.config
+        return RingBuffer(slots, config.MAXFRAMES, config.SIZE[1], config.SIZE[0], channels)
+
+    def attach(self):
+        buf = self.memory.buf
+        self.data = np.ndarray(self.shape, dtype=np.uint8, buffer=buf)
+        offset = getAligned(self.data.nbytes)
+        self.header = np.ndarray((len(HEADERFIELDS),), dtype=np.int64, buffer=buf, offset=offset)
+        self.slots = np.ndarray((self.shape[0], len(SLOTFIELDS)), dtype=np.int64, buffer=buf, offset=offset+self.header.nbytes)
+        self.error = np.ndarray((ERRORSIZE,), dtype=np.uint8, buffer=buf, offset=offset+self.header.nbytes+self.slots.nbytes)
+
+    #Only needed if the producers are started with spawn, with fork the memory is simply inherited
+    def __getstate__(self):
+        return {'shape': self.shape, 'condition': self.condition, 'name': self.memory.name}
+
+    def __setstate__(self, state):
+        self.shape = state['shape']
+        self.condition = state['condition']
+        self.memory = attachMemory(state['name'])
+        self.owner = False
+        self.attach()
+
+    def getField(self, slot, field):
+        return int(self.slots[slot, SLOTFIELDS.index(field)])
+
+    def setFields(self, slot, **values):
+        for field in values:
+            self.slots[slot, SLOTFIELDS.index(field)] = values[field]
+
+    def isClosed(self):
+        return self.header[HEADERFIELDS.index("closed")] != 0
+
+    #Waits (with the condition held) until findSlot returns a slot. Raises queue.Empty/queue.Full after the timeout
+    def waitForSlot(self, findSlot, block, timeout, timeoutError):
+        slot = findSlot()
+        if(slot is None and block):
+            self.condition.wait_for(lambda: findSlot() is not None, timeout)
+            slot = findSlot()
+        if(slot is None):
+            raise timeoutError
+        return slot
+
+    def findFreeSlot(self):
+        if(self.isClosed()):
+            raise BufferClosed()
+        free = np.nonzero(self.slots[:, 0] == FREE)[0]
+        return int(free[0]) if len(free) > 0 else None
+
+    def findReadySlot(self):
+        failed = int(self.header[HEADERFIELDS.index("failed")])
+        if(failed != 0):
+            raise ProducerFailed("producer %d failed:\n%s" % (failed-1, bytes(self.error).rstrip(b"\0").decode('utf-8', 'replace')))
+        ready = np.nonzero(self.slots[:, 0] == READY)[0]
+        if(len(ready) == 0):
+            if(self.isClosed()):
+                raise BufferClosed()
+            return None
+        return int(ready[np.argmin(self.slots[ready, 1])])     #oldest series first
+
+    #Copies the frames (list or array of (height, width, >=channels) arrays) of a series into a free slot
+    def put(self, frames, index=0, producer=0, block=True, timeout=None):
+        if(len(frames) > self.shape[1]):
+            raise ValueError("the series has %d frames, the slots only %d" % (len(frames), self.shape[1]))
+        with self.condition:
+            slot = self.waitForSlot(self.findFreeSlot, block, timeout, queue.Full())
+            self.setFields(slot, state=WRITING)
+        channels = self.shape[4]
+        try:
+            for i in range(len(frames)):    #the slot belongs to this producer now, no lock needed
+                self.data[slot, i] = frames[i][:, :, :channels]
+        except Exception:   #e.g. a frame of another size, the slot must not stay WRITING
+            self.release(slot)
+            raise
+        with self.condition:
+            sequence = self.header[HEADERFIELDS.index("sequence")]
+            self.header[HEADERFIELDS.index("sequence")] += 1
+            self.setFields(slot, state=READY, sequence=sequence, index=index, frames=len(frames), producer=producer)
+            self.condition.notify_all()
+
+    #Returns a Slot with a view of the oldest ready series. Raises queue.Empty if there is none (block=False or
+    #after the timeout), BufferClosed if the buffer is closed and empty and ProducerFailed if a producer failed
+    def get(self, block=True, timeout=None):
+        with self.condition:
+            slot = self.waitForSlot(self.findReadySlot, block, timeout, queue.Empty())
+            self.setFields(slot, state=READING)
+        return Slot(self, slot, self.getField(slot, "index"), self.getField(slot, "frames"), self.getField(slot, "producer"))
+
+    def release(self, slot):
+        with self.condition:
+            self.setFields(slot, state=FREE)
+            self.condition.notify_all()
+
+    #No new series are accepted, waiting producers raise BufferClosed. The ready series can still be read
+    def close(self):
+        with self.condition:
+            self.header[HEADERFIELDS.index("closed")] = 1
+            self.condition.notify_all()
+
+    #Records the error of a producer (only the first one is kept) and closes the buffer, so the other producers stop
+    #and the consumers get ProducerFailed instead of the normal end of the job
+    def fail(self, producer, message):
+        with self.condition:
+            if(self.header[HEADERFIELDS.index("failed")] == 0):
+                self.header[HEADERFIELDS.index("failed")] = producer+1
+                data = message.encode('utf-8')[:ERRORSIZE]
+                self.error[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+            self.header[HEADERFIELDS.index("closed")] = 1
+            self.condition.notify_all()
+
+    def addProducers(self, count):  #the buffer is closed when the last producer is done
+        with self.condition:
+            self.header[HEADERFIELDS.index("producers")] += count
+            if(self.header[HEADERFIELDS.index("producers")] <= 0):
+                self.header[HEADERFIELDS.index("closed")] = 1
+                self.condition.notify_all()
+
+    #Frees the shared memory. All slots have to be released before
+    def shutdown(self):
+        self.close()
+        del self.data, self.header, self.slots, self.error
+        self.memory.close()
+        if(self.owner):
+            self.memory.unlink()
+
+    def __str__(self):
+        states = [self.getField(slot, "state") for slot in range(self.shape[0])]
+        print("Slots: ", self.shape[0], " shape: ", self.shape[1:])
+        print("free/writing/ready/reading: ", [states.count(state) for state in (FREE, WRITING, READY, READING)])
+        return ""
+
+#One series in the buffer. frames is a view into the shared memory and only valid until release
+class Slot():
+    def __init__(self, buffer, slot, index, frameCount, producer):
+        self.buffer = buffer
+        self.slot = slot
+        self.index = index
+        self.producer = producer
+        self.frames = buffer.data[slot, :frameCount]
+
+    def release(self):
+        if(self.frames is not None):
+            self.frames = None
+            self.buffer.release(self.slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+def getAligned(size, alignment=64):
+    return (size+alignment-1)//alignment*alignment
+
+#The creating process unlinks the memory, not the ones which only attach. Before python 3.13 (no track) the
+#producers share the resource tracker of the creating process, so registering the memory again doesn't matter
+def attachMemory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+#Producer process: creates the series producer, producer+producers, ... of the job (all if job.series is 0)
+#and puts them into the buffer until the job is done or the buffer is closed. Errors are passed to the consumers (see fail)
+def runProducer(buffer, job, producer, producers):
+    series = jobRunner.getJobSeries(job)
+    config = job.config
+    index = producer
+    try:
+        while(job.series == 0 or index < job.series):
+            jobRunner.seedSeries(job.seed, index)
+            series.setSeriesLength(random.randint(config.MINFRAMES, config.MAXFRAMES))
+            buffer.put(series.getSeries(), index, producer)
+            index += producers
+    except BufferClosed:
+        pass
+    except Exception:
+        buffer.fail(producer, traceback.format_exc())
+        raise
+    finally:
+        buffer.addProducers(-1)
+
+def startProducers(buffer, job, workers=None):
+    workers = job.workers if workers is None else workers
+    buffer.addProducers(workers)
+    processes = [Process(target=runProducer, args=(buffer, job, i, workers)) for i in range(workers)]
+    for process in processes:
+        process.daemon = True
+        process.start()
+    return processes
+
+def joinProducers(processes, timeout=None):
+    for process in processes:
+        process.join(timeout)
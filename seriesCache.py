@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#Cache of rendered series for replayed trajectories (getSeriesWithParam, getSeriesFromFile). The key is a hash of the
+#scene record, the offset, the values of the config which change the pixels, the backend and the size and mtime of the
+#used image files. The series are kept in memory and, with a folder, on disk as .npy files, both are limited in bytes
+#and the least recently used series are removed first:
+#   cache = SeriesCache(maxMemory=512*2**20, folder="seriesCache", maxDisk=8*2**30)
+#   series = ImageSeries(config=config, cache=cache)
+#   series.getSeriesFromFile("trajectories/trajectories.json")   #the second replay doesn't render anything
+#Only series without other outputs are cached (no noise, flow, masks or saving, see isCacheable).
+#Several processes can share the folder (e.g. the workers of TrajectoryDataset), a series written by one is found by
+#all. maxDisk is the limit of the whole folder: every process adds the sizes of its writes to the size of the folder
+#at its last scan. When this goes over maxDisk, the folder is listed again under a file lock (only on systems with
+#fcntl) and the oldest entries of all processes are removed down to EVICTTO*maxDisk. So the folder can only go over
+#maxDisk by the writes of the other processes since the last scan.
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LOCKFILENAME = ".lock"
+STALETMPAGE = 600   #seconds, older temporary files are left by crashed writers and removed
+EVICTTO = 0.9       #part of maxDisk which is left after an eviction, so not every write has to scan the folder
+
+#Config values which don't change the rendered pixels
+IGNOREDCONFIG = ["PATHBACKGROUNDFOLDER", "PATHOBJECTFOLDER", "PATHTOTRAJECTORYFILE", "SERIESNAME", "SERIESFOLDER",
+                 "PATHPYRAMIDCACHE", "PATHATLAS", "PATHBACKGROUNDCACHE", "STATSLOGINTERVAL", "SPRITECACHESIZE",
+                 "PREMULTIPLIEDSPRITES", "COMPILEDKERNELS", "RENDERTHREADS"]
+#The cache only holds the frames, a series with one of these options has to be rendered
+UNCACHEABLECONFIG = ["IMAGENOISE", "GETSEGMENTATIONMASK", "GETOPTICALFLOW", "SAFEIMAGES", "SAFETRAJECTORY",
+                     "SAVESEGMENTATIONMASK", "SAVEOPTICALFLOW"]
+
+def isCacheable(config):
+    return not any(getattr(config, name) for name in UNCACHEABLECONFIG)
+
+def getFileStamp(file):     #size and mtime, so changed images don't hit old entries
+    try:
+        stat = os.stat(file)
+        return [stat.st_size, stat.st_mtime]
+    except OSError:
+        return None
+
+def getKey(frames, trajectories, offset, config, backend, size):
+    config = dict((name, value) for name, value in config._asdict().items() if name not in IGNOREDCONFIG)
+    files = sorted(set(obj['f'] for obj in trajectories))
+    data = {'frames': frames, 'trajectories': trajectories, 'offset': offset, 'config': config, 'backend': backend,
+            'size': list(size), 'files': [[file, getFileStamp(file)] for file in files]}
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+class SeriesCache():
+    def __init__(self, maxMemory=256*2**20, folder=None, maxDisk=4*2**30):
+        self.maxMemory = maxMemory
+        self.maxDisk = maxDisk
+        self.folder = folder
+        self.memory = OrderedDict()     #key -> (frames, height, width, 4) array, least recently used first
+        self.memorySize = 0
+        self.disk = OrderedDict()       #key -> size of the file
+        self.diskSize = 0
+        self.lock = threading.Lock()
+        if(folder is not None):
+            self.loadIndex()
+
+    #Other processes (e.g. the workers of TrajectoryDataset) share the folder, not the series in memory
+    def __getstate__(self):
+        return {'maxMemory': self.maxMemory, 'folder': self.folder, 'maxDisk': self.maxDisk}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    #(mtime, key, size) of all entries in the folder in the order of their last use (mtime, see get).
+    #Temporary files of crashed writers are removed
+    def scanFolder(self):
+        entries = []
+        for sub in os.listdir(self.folder) if os.path.isdir(self.folder) else []:
+            if(not os.path.isdir(self.folder+"/"+sub)):
+                continue
+            for name in os.listdir(self.folder+"/"+sub):
+                file = self.folder+"/"+sub+"/"+name
+                try:
+                    stat = os.stat(file)
+                    if(name.endswith(".npy")):
+                        entries.append((stat.st_mtime, name[:-4], stat.st_size))
+                    elif(name.endswith(".tmp") and time.time()-stat.st_mtime > STALETMPAGE):
+                        os.remove(file)
+                except OSError:     #removed by another process in the meantime
+                    pass
+        return sorted(entries)
+
+    def loadIndex(self):    #the lock has to be held (or the cache is not shared yet)
+        self.disk = OrderedDict()
+        self.diskSize = 0
+        for mtime, key, size in self.scanFolder():
+            self.disk[key] = size
+            self.diskSize += size
+
+    #Removes the least recently used entries of all processes until the folder is below EVICTTO*maxDisk
+    def evictDisk(self):
+        with open(self.folder+"/"+LOCKFILENAME, 'a') as lockFile:
+            if(fcntl is not None):
+                fcntl.flock(lockFile, fcntl.LOCK_EX)    #released when the file is closed
+            with self.lock:
+                self.loadIndex()
+                while(self.diskSize > EVICTTO*self.maxDisk):
+                    self.removeFromDisk(next(iter(self.disk)))
+
+    def getFile(self, key):
+        return self.folder+"/"+key[:2]+"/"+key+".npy"
+
+    #Returns the frames or None. The array is read only, it is shared with the cache.
+    #Keys which aren't in the index can have been written by another process since the last scan
+    def get(self, key):
+        with self.lock:
+            if(key in self.memory):
+                self.memory.move_to_end(key)
+                return self.memory[key]
+            known = key in self.disk
+            if(known):
+                self.disk.move_to_end(key)
+        if(self.folder is None):
+            return None
+        try:
+            frames = np.load(self.getFile(key))
+            os.utime(self.getFile(key), None)   #last use for the next start
+        except FileNotFoundError:   #not written yet or removed by another process
+            if(known):
+                with self.lock:
+                    self.removeFromDisk(key)
+            return None
+        except (OSError, ValueError):   #broken
+            with self.lock:
+                self.removeFromDisk(key)
+            return None
+        if(not known):
+            self.addToDisk(key)
+        self.putInMemory(key, frames)
+        return frames
+
+    def addToDisk(self, key):   #returns True if the tracked size of the folder is over maxDisk
+        try:
+            size = os.path.getsize(self.getFile(key))
+        except OSError:
+            return False
+        with self.lock:
+            if(key not in self.disk):
+                self.disk[key] = size
+                self.diskSize += size
+            return self.diskSize > self.maxDisk
+
+    def put(self, key, frames):
+        frames = np.ascontiguousarray(frames, dtype=np.uint8)
+        self.putInMemory(key, frames)
+        if(self.folder is None or frames.nbytes > self.maxDisk):
+            return
+        with self.lock:
+            if(key in self.disk):
+                return
+        file = self.getFile(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        tmpFile = file+".%d.tmp" % os.getpid()  #several processes could write the same entry
+        with open(tmpFile, 'wb') as f:
+            np.save(f, frames)
+        os.replace(tmpFile, file)
+        if(self.addToDisk(key)):
+            self.evictDisk()
+
+    def putInMemory(self, key, frames):
+        if(frames.nbytes > self.maxMemory):
+            return
+        frames.flags.writeable = False
+        with self.lock:
+            if(key in self.memory):
+                return
+            self.memory[key] = frames
+            self.memorySize += frames.nbytes
+            while(self.memorySize > self.maxMemory):
+                key, old = self.memory.popitem(last=False)
+                self.memorySize -= old.nbytes
+
+    def removeFromDisk(self, key):  #the lock has to be held
+        self.diskSize -= self.disk.pop(key, 0)
+        try:
+            os.remove(self.getFile(key))
+        except OSError:
+            pass
+
+    def __str__(self):
+        print("Series in memory: ", len(self.memory), " (%.1f MB)" % (self.memorySize/2.**20))
+        print("Series on disk: ", len(self.disk), " (%.1f MB)" % (self.diskSize/2.**20))
+        return ""
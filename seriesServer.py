@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#Generator service for several training processes on one machine. The server loads the backgrounds and objects once,
+#starts a pool of worker processes (they share the loaded images after fork) and serves series over a unix socket.
+#Every client sends its own config values and seed, then requests batches of series indices. The series are sent as raw
+#uint8 arrays, no image encoding. Series i of a client with seed s is the same as series i of a job with seed s.
+#   python seriesServer.py --socket /tmp/imageSeries.sock --workers 4 --backgrounds backgrounds --objects objects
+#   client = SeriesClient("/tmp/imageSeries.sock", {"SIZE": [64, 64]}, seed=1)
+#   for index, frames in client.getBatch(0, 32): ...    #frames: (frames, height, width, 4) array
+#Messages are a header (magic, type, length of the payload) followed by the payload:
+#   client: CONFIG (json: config, seed), BATCH (json: start, count), QUIT
+#   server: SERIES (index, frames, height, width, channels, pixels), END (after every batch and config), ERROR (json: message)
+#Flow control: a client has at most --window series in the pool at the same time. The next series is only started
+#when the oldest one is sent, so a slow client can't make the server fill its memory.
+#The images are loaded once for all clients, so a client can't change the config values of the loading (HANDLERCONFIG),
+#the server answers a CONFIG with other values with an ERROR.
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import socketserver
+import struct
+import sys
+from collections import deque
+from multiprocessing import Pool
+import numpy as np
+import finalImageSeries
+import jobRunner
+
+MAGIC = b"ISRV"
+HEADER = struct.Struct("!4sBQ")
+SERIESHEADER = struct.Struct("!qIIII")
+CONFIG, BATCH, QUIT, SERIES, END, ERROR = 1, 2, 3, 4, 5, 6
+#config values which are used by ImageHandler
+HANDLERCONFIG = ["BACKEND", "USEPYRAMID", "MINPYRAMIDSIZE", "PATHPYRAMIDCACHE", "USEATLAS", "PATHATLAS", "PATHBACKGROUNDCACHE"]
+
+def sendMessage(sock, messageType, payload=b""):
+    sock.sendall(HEADER.pack(MAGIC, messageType, len(payload)))
+    if(len(payload) > 0):
+        sock.sendall(payload)
+
+def receiveExactly(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while(received < size):
+        n = sock.recv_into(view[received:], size-received)
+        if(n == 0):
+            raise EOFError("connection closed")
+        received += n
+    return buf
+
+def receiveMessage(sock):   #returns (type, payload)
+    magic, messageType, length = HEADER.unpack(receiveExactly(sock, HEADER.size))
+    if(magic != MAGIC):
+        raise ValueError("not a series server message")
+    return messageType, receiveExactly(sock, length)
+
+def encodeSeries(index, frames):
+    frames = np.ascontiguousarray(frames, dtype=np.uint8)
+    return SERIESHEADER.pack(index, *frames.shape)+frames.tobytes()
+
+def decodeSeries(payload):  #the array is a view of the received buffer, no copy
+    index, frames, height, width, channels = SERIESHEADER.unpack_from(payload)
+    return index, np.frombuffer(payload, dtype=np.uint8, offset=SERIESHEADER.size).reshape(frames, height, width, channels)
+
+#The images are loaded before the pool is started, so all workers share them after fork. With spawn or forkserver the
+#workers don't inherit them, initWorker loads them again from the same folders
+serverImages = None
+workerSeries = {}   #config -> ImageSeries of the worker
+
+def loadImages(background, objects, backend):
+    import renderBackends
+    config = finalImageSeries.getConfig()
+    return finalImageSeries.ImageHandler(config.PATHBACKGROUNDFOLDER if background is None else background,
+                                         config.PATHOBJECTFOLDER if objects is None else objects,
+                                         None if backend is None else renderBackends.getBackend(backend), config)
+
+def getHandlerValue(name):  #value of HANDLERCONFIG with which the images of the server are loaded
+    return serverImages.backend.name if name == "BACKEND" else getattr(serverImages.config, name)
+
+#The config of a client. The series are sent and never saved, the values of HANDLERCONFIG are the ones of the server
+def getClientConfig(values):
+    changed = [name for name in HANDLERCONFIG if name in values and finalImageSeries.toImmutable(values[name]) != getHandlerValue(name)]
+    if(len(changed) > 0):
+        raise ValueError("the images of the server are loaded with other values, they can't be changed by a client: "+
+                         ", ".join("%s=%r" % (name, getHandlerValue(name)) for name in changed))
+    values = dict(values, SAFEIMAGES=False, SAFETRAJECTORY=False, SAVESEGMENTATIONMASK=False, SAVEOPTICALFLOW=False)
+    values.update((name, getHandlerValue(name)) for name in HANDLERCONFIG)
+    return finalImageSeries.getConfig(**values)
+
+def initWorker(background, objects, backend):
+    global serverImages
+    if(serverImages is None):
+        serverImages = loadImages(background, objects, backend)
+
+def renderSeries(task):
+    config, seed, index = task
+    if(config not in workerSeries):
+        workerSeries[config] = finalImageSeries.ImageSeries(config=config, images=serverImages)
+    series = workerSeries[config]
+    jobRunner.seedSeries(seed, index)
+    series.setSeriesLength(random.randint(config.MINFRAMES, config.MAXFRAMES))
+    return encodeSeries(index, np.stack(series.getSeries()))
+
+class SeriesHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        config, seed = None, 0
+        while(True):
+            try:
+                messageType, payload = receiveMessage(self.request)
+            except EOFError:
+                return
+            try:
+                if(messageType == CONFIG):
+                    data = json.loads(payload.decode('utf-8'))
+                    config = getClientConfig(data.get('config', {}))
+                    seed = data.get('seed', 0)
+                    sendMessage(self.request, END)
+                elif(messageType == BATCH):
+                    data = json.loads(payload.decode('utf-8'))
+                    self.sendBatch(getClientConfig({}) if config is None else config, seed, data['start'], data['count'])
+                elif(messageType == QUIT):
+                    return
+                else:
+                    raise ValueError("unknown message type: %d" % messageType)
+            except Exception as e:  #also errors of the workers, the client gets an ERROR instead of a closed connection
+                try:
+                    sendMessage(self.request, ERROR, json.dumps({'message': str(e)}).encode('utf-8'))
+                except OSError:     #the client is gone
+                    return
+
+    def sendBatch(self, config, seed, start, count):
+        pool, window = self.server.pool, self.server.window
+        pending = deque()
+        index = start
+        try:
+            while(index < start+count or len(pending) > 0):
+                while(index < start+count and len(pending) < window):
+                    pending.append(pool.apply_async(renderSeries, ((config, seed, index),)))
+                    index += 1
+                sendMessage(self.request, SERIES, pending.popleft().get())
+        except Exception:
+            for result in pending:  #the started series are finished before the next batch, so the window holds
+                result.wait()
+            raise
+        sendMessage(self.request, END)
+
+class SeriesServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, background=None, objects=None, backend=None, workers=2, window=8):
+        global serverImages
+        serverImages = loadImages(background, objects, backend)
+        self.pool = Pool(workers, initWorker, (background, objects, backend))
+        self.window = window
+        if(os.path.exists(path)):   #left over from a stopped server
+            os.remove(path)
+        socketserver.UnixStreamServer.__init__(self, path, SeriesHandler)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self.pool.terminate()
+        if(os.path.exists(self.server_address)):
+            os.remove(self.server_address)
+
+class SeriesClient():
+    def __init__(self, path, config=None, seed=0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        sendMessage(self.sock, CONFIG, json.dumps({'config': {} if config is None else config, 'seed': seed}).encode('utf-8'))
+        try:
+            self.receiveEnd()
+        except Exception:
+            self.sock.close()
+            raise
+
+    def receiveEnd(self):   #the answer to CONFIG
+        messageType, payload = receiveMessage(self.sock)
+        if(messageType == ERROR):
+            raise ValueError(json.loads(payload.decode('utf-8'))['message'])
+        if(messageType != END):
+            raise ValueError("unexpected message type: %d" % messageType)
+
+    #Yields (index, frames) for the series start ... start+count-1 in this order
+    def getBatch(self, start, count):
+        sendMessage(self.sock, BATCH, json.dumps({'start': start, 'count': count}).encode('utf-8'))
+        while(True):
+            messageType, payload = receiveMessage(self.sock)
+            if(messageType == END):
+                return
+            elif(messageType == ERROR):
+                raise ValueError(json.loads(payload.decode('utf-8'))['message'])
+            yield decodeSeries(payload)
+
+    def close(self):
+        try:
+            sendMessage(self.sock, QUIT)
+        finally:
+            self.sock.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves image series to training processes over a unix socket")
+    parser.add_argument("--socket", default="/tmp/imageSeries.sock")
+    parser.add_argument("--backgrounds", default=None)
+    parser.add_argument("--objects", default=None)
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--window", type=int, default=8, help="series per client which are created in advance")
+    args = parser.parse_args()
+    server = SeriesServer(args.socket, args.backgrounds, args.objects, args.backend, args.workers, args.window)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))    #the socket file is removed in server_close
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#Timing counters of the generator. ImageSeries adds the time of every stage (see STAGES), the latency of
+#every series and some counters (sprite cache, culled objects). getSummary returns everything as dict,
+#with a logInterval (seconds) a summary line is printed after a series if the interval has passed.
+#Times and counters can be added from several threads (RENDERTHREADS), the stage times are the sum over all threads then.
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+STAGES = ["background", "trajectory", "transform", "paste", "noise", "encode", "write"]
+COUNTERS = ["series", "frames", "drawnObjects", "culledObjects", "spriteCacheHits", "spriteCacheMisses", "seriesCacheHits", "seriesCacheMisses"]
+
+#Histogram with logarithmic buckets (factor 2 per bucket) from minValue to maxValue in seconds
+class LatencyHistogram():
+    def __init__(self, minValue=1e-4, maxValue=1e3):
+        self.minValue = minValue
+        self.bucketCount = int(math.ceil(math.log(maxValue/minValue, 2)))+1
+        self.buckets = [0]*(self.bucketCount+1)     #first bucket: < minValue, last bucket: >= maxValue
+        self.count = 0
+        self.sum = 0.
+        self.min = None
+        self.max = None
+
+    def getBucket(self, value):
+        if(value < self.minValue):
+            return 0
+        return min(int(math.log(value/self.minValue, 2))+1, self.bucketCount)
+
+    def getBucketBound(self, bucket):   #upper bound of the bucket
+        return self.minValue*2**bucket
+
+    def add(self, value):
+        self.buckets[self.getBucket(value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def getPercentile(self, p):     #upper bound of the bucket which contains the percentile p (0-100)
+        if(self.count == 0):
+            return None
+        rank = p/100.*self.count
+        total = 0
+        for bucket in range(len(self.buckets)):
+            total += self.buckets[bucket]
+            if(total >= rank and total > 0):
+                return min(self.getBucketBound(bucket), self.max)
+        return self.max
+
+    def getSummary(self):
+        return {'count': self.count, 'mean': self.sum/self.count if self.count else None, 'min': self.min, 'max': self.max,
+                'p50': self.getPercentile(50), 'p90': self.getPercentile(90), 'p99': self.getPercentile(99),
+                'buckets': dict((self.getBucketBound(b), self.buckets[b]) for b in range(len(self.buckets)) if self.buckets[b] > 0)}
+
+class SeriesStats():
+    def __init__(self, logInterval=None):
+        self.logInterval = logInterval
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.stageTime = dict((stage, 0.) for stage in STAGES)
+        self.stageCalls = dict((stage, 0) for stage in STAGES)
+        self.counters = dict((counter, 0) for counter in COUNTERS)
+        self.latency = LatencyHistogram()
+        self.start = time.time()
+        self.lastLog = self.start
+
+    def addTime(self, stage, seconds):
+        with self.lock:
+            self.stageTime[stage] += seconds
+            self.stageCalls[stage] += 1
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addTime(stage, time.perf_counter()-start)
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+
+    def addSeries(self, seconds, frames):
+        self.latency.add(seconds)
+        self.counters['series'] += 1
+        self.counters['frames'] += frames
+        if(self.logInterval is not None and time.time()-self.lastLog >= self.logInterval):
+            self.lastLog = time.time()
+            print(self.getLogLine())
+
+    def getSummary(self):
+        elapsed = time.time()-self.start
+        return {'elapsed': elapsed, 'seriesPerSecond': self.counters['series']/elapsed if elapsed > 0 else None,
+                'stageTime': dict(self.stageTime), 'stageCalls': dict(self.stageCalls), 'counters': dict(self.counters),
+                'latency': self.latency.getSummary()}
+
+    def getLogLine(self):
+        summary = self.getSummary()
+        total = sum(self.stageTime.values())
+        stages = " ".join("%s %.0f%%" % (stage, 100.*self.stageTime[stage]/total) for stage in STAGES if total > 0 and self.stageTime[stage] > 0)
+        cache = self.counters['spriteCacheHits']+self.counters['spriteCacheMisses']
+        return ("series: %d (%.2f/s) latency p50 %.1f ms p99 %.1f ms | %s | culled: %d/%d | sprite cache hits: %.0f%%" %
+                (self.counters['series'], summary['seriesPerSecond'] or 0, 1000*(self.latency.getPercentile(50) or 0),
+                 1000*(self.latency.getPercentile(99) or 0), stages, self.counters['culledObjects'],
+                 self.counters['culledObjects']+self.counters['drawnObjects'], 100.*self.counters['spriteCacheHits']/cache if cache else 0))
+
+    def __str__(self):
+        print(self.getLogLine())
+        return ""
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#Packs all object sprites (and their pyramid levels) into a few large contiguous RGBA pages.
+#Every sprite is only a view into a page, so thousands of small objects don't need their own image headers.
+#Saved atlases are loaded memory mapped, so all worker processes share the same pages. A saved atlas records the size
+#and mtime of its sprite files (see getSource), it is only reused for the same files.
+from PIL import Image
+import numpy as np
+import json
+import os
+
+ATLASPAGESIZE = 2048    #maximal width and height of a page (larger sprites get a page on their own)
+INDEXFILENAME = "atlas.json"
+
+#files and the settings of the levels, in the form it is stored in the index
+def getSource(files, levels=None):
+    stamps = []
+    for file in sorted(files):
+        stat = os.stat(file)
+        stamps.append([file, stat.st_size, stat.st_mtime])
+    return json.loads(json.dumps({'files': stamps, 'levels': levels}))
+
+#With a source (see getSource) the atlas has to be saved for the same one
+def atlasExists(folder, source=None):
+    if(not os.path.exists(folder+"/"+INDEXFILENAME)):
+        return False
+    if(source is None):
+        return True
+    with open(folder+"/"+INDEXFILENAME, 'r') as f:
+        return json.load(f).get('source') == source
+
+class SpriteAtlas():
+    def __init__(self, pages, index, source=None):
+        self.pages = pages  #list of arrays with shape (height, width, 4)
+        self.index = index  #key -> list of rectangles [page, x, y, width, height], one per pyramid level
+        self.source = source
+
+    #images: key -> list of PIL images (level 0 first). Sprites are packed in shelves, the highest first.
+    @staticmethod
+    def build(images, pageSize=ATLASPAGESIZE, source=None):
+        rects = []
+        for key in images:
+            for level in range(len(images[key])):
+                w, h = images[key][level].size
+                rects.append((h, w, key, level))
+        rects.sort(key=lambda r: (-r[0], -r[1]))
+        index = {}
+        for key in images:
+            index[key] = [None]*len(images[key])
+        pageSizes = []  #[width, height] of every page
+        page, x, y, shelfHeight = -1, pageSize, 0, 0
+        for h, w, key, level in rects:
+            if(w > pageSize or h > pageSize):   #too large for a shared page
+                pageSizes.append([w, h])
+                index[key][level] = [len(pageSizes)-1, 0, 0, w, h]
+                continue
+            if(x+w > pageSize):     #next shelf
+                x, y, shelfHeight = 0, y+shelfHeight, h
+            if(page < 0 or y+h > pageSize):     #next page
+                pageSizes.append([pageSize, 0])
+                page, x, y, shelfHeight = len(pageSizes)-1, 0, 0, h
+            index[key][level] = [page, x, y, w, h]
+            pageSizes[page][1] = max(pageSizes[page][1], y+h)
+            x += w
+        pages = [np.zeros((h+1, w, 4), dtype=np.uint8) for w, h in pageSizes]   #one spare row, see getImage
+        for key in images:
+            for level in range(len(images[key])):
+                p, x, y, w, h = index[key][level]
+                pages[p][y:y+h, x:x+w] = np.asarray(images[key][level].convert('RGBA'))
+        return SpriteAtlas(pages, index, source)
+
+    @staticmethod
+    def load(folder, mmap=True):
+        with open(folder+"/"+INDEXFILENAME, 'r') as f:
+            data = json.load(f)
+        pages = [np.load(folder+"/"+name, mmap_mode='r' if mmap else None) for name in data['pages']]
+        return SpriteAtlas(pages, data['index'], data.get('source'))
+
+    def save(self, folder):
+        if(not os.path.exists(folder)):
+            os.makedirs(folder)
+        names = []
+        for i in range(len(self.pages)):
+            names.append("page%d.npy" % i)
+            np.save(folder+"/"+names[i], np.asarray(self.pages[i]))
+        with open(folder+"/"+INDEXFILENAME+".tmp", 'w') as f:  #the index is written last, so an atlas without index is never loaded
+            json.dump({'pages': names, 'index': self.index, 'source': self.source}, f)
+        os.replace(folder+"/"+INDEXFILENAME+".tmp", folder+"/"+INDEXFILENAME)
+
+    def getKeys(self):
+        return list(self.index.keys())
+
+    def getSprite(self, key, level=0):  #view into the page, don't write to it
+        p, x, y, w, h = self.index[key][level]
+        return self.pages[p][y:y+h, x:x+w]
+
+    def getLevelCount(self, key):
+        return len(self.index[key])
+
+    #Read only PIL image which maps the pixels of the page, no copy. PIL checks that height*(row length of the page)
+    #bytes follow the first pixel, so a sprite in the last row of a page only fits with the spare row of build.
+    #Older atlases without it get a copy for these sprites
+    def getImage(self, key, level=0):
+        p, x, y, w, h = self.index[key][level]
+        page = self.pages[p]
+        try:
+            data = memoryview(page.reshape(-1))[(y*page.shape[1]+x)*4:]
+            return Image.frombuffer('RGBA', (w, h), data, 'raw', 'RGBA', page.shape[1]*4, 1)
+        except ValueError:
+            return Image.fromarray(np.ascontiguousarray(self.getSprite(key, level)), 'RGBA')
+
+    def getPyramid(self, key):
+        return [self.getImage(key, level) for level in range(self.getLevelCount(key))]
+
+    def __str__(self):
+        print("Sprites in atlas: ", len(self.index))
+        print("Pages: ", [page.shape for page in self.pages])
+        return ""
@@ -1,31 +1,70 @@
-import ImageSeriesSKImage
-import finalImageSeries
-import threading
-from multiprocessing import Pool
-import timeit
-import numpy as np
-from skimage import io as SKIIO
-import skimage
-from skimage import *
-from skimage import transform
-if(False):   #test bg crop
-    IH = ImageSeriesSKImage.ImageHandler("backgrounds","objects")
-    bgImg = IH.getRandomBg()[0]
-    top=50
-    left = 90
-    h = 64
-    w = 64
-    bgImg = util.crop(bgImg,((top,bgImg.shape[0]-h-top),(left, bgImg.shape[1]-w-left),(0,0)))
-    #SKIIO.imsave("testbg.png", bgImg)
-    
-if(False):   #test transform with skimage
-    IH = ImageSeriesSKImage.ImageHandler("backgrounds","objects")
-    img = IH.getRandomObj()[0]
-    trans = transform.AffineTransform(scale=(.2,.2), rotation=np.pi/2., translation=(10,10))
-    newImg = transform.warp(img, inverse_map=trans, clip=False, preserve_range=False)
-    SKIIO.imsave("transformationDavor.png", img)
-    SKIIO.imsave("transformationDanach.png", newImg)
-    
-if(True):
-    IM = finalImageSeries.ImageSeries()
-    IM.getSeries()
\ No newline at end of file
+# -*- coding: utf-8 -*-
+#Entry point of the generator. The arguments are parsed before anything heavy is imported, the generator and
+#the output sink are imported afterwards and only the selected backend is created (scikit-image is only imported
+#for --backend skimage). --timing prints how long the imports took, every spawned worker process pays this again.
+#   python start.py
+#   python start.py --series 100 --backend numpy --sink shard --output imgSeries --timing
+import time
+STARTTIME = time.perf_counter()
+import argparse
+
+def parseArgs(args=None):
+    parser = argparse.ArgumentParser(description="Creates image series with moving objects on a background")
+    parser.add_argument("--series", type=int, default=1, help="number of series")
+    parser.add_argument("--backgrounds", default=None, help="folder with the backgrounds (default: PATHBACKGROUNDFOLDER)")
+    parser.add_argument("--objects", default=None, help="folder with the objects (default: PATHOBJECTFOLDER)")
+    parser.add_argument("--backend", default=None, help="pil, numpy, skimage or numba (default: BACKEND)")
+    parser.add_argument("--sink", default="none", choices=["none", "folder", "shard", "layered"],
+                        help="none saves like the config (SAFEIMAGES), folder/shard/layered write every series with outputSink")
+    parser.add_argument("--output", default=None, help="output folder (default: SERIESFOLDER)")
+    parser.add_argument("--name", default=None, help="filename of the frames (default: SERIESNAME)")
+    parser.add_argument("--seriesPerShard", type=int, default=1000)
+    parser.add_argument("--timing", action="store_true", help="prints import, load and generation time")
+    return parser.parse_args(args)
+
+def main(args=None):
+    args = parseArgs(args)
+    parsed = time.perf_counter()
+    import finalImageSeries
+    importTime = time.perf_counter()-parsed
+    start = time.perf_counter()
+    backend = None
+    if(args.backend is not None):
+        import renderBackends
+        backend = renderBackends.getBackend(args.backend)
+    backendTime = time.perf_counter()-start
+    folder = finalImageSeries.SERIESFOLDER if args.output is None else args.output
+    name = finalImageSeries.SERIESNAME if args.name is None else args.name
+    sink = None
+    config = finalImageSeries.getConfig() if args.sink == "none" else finalImageSeries.getConfig(SAFEIMAGES=False, SAVEOPTICALFLOW=False)    #the sink writes the series
+    if(args.sink != "none"):
+        import outputSink
+        if(args.sink == "folder"):
+            sink = outputSink.FolderSink(folder, name)
+        elif(args.sink == "layered"):
+            sink = outputSink.LayeredSink(folder, name)
+        else:
+            sink = outputSink.ShardSink(folder, name, args.seriesPerShard)
+    if(args.timing):
+        print("import: %.1f ms (startup %.1f ms, finalImageSeries %.1f ms, backend %.1f ms)" % (1000*(time.perf_counter()-STARTTIME),
+              1000*(parsed-STARTTIME), 1000*importTime, 1000*backendTime))
+
+    start = time.perf_counter()
+    series = finalImageSeries.ImageSeries(args.backgrounds, args.objects, None, 0, backend, config)
+    if(args.timing):
+        print("load: %.1f ms" % (1000*(time.perf_counter()-start)))
+    start = time.perf_counter()
+    try:
+        for index in range(args.series):
+            series.getSeries()
+            if(sink is not None):
+                sink.writeSeries(series, index)
+    finally:
+        if(sink is not None):
+            sink.close()
+    if(args.timing):
+        print("series: %.1f ms for %d series" % (1000*(time.perf_counter()-start), args.series))
+        print(series.getStats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+#A replayed series from the cache has to look like a rendered one: same frames, ndarrays, and they can be saved
+import os
+import sys
+import numpy as np
+import pytest
+from PIL import Image
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import finalImageSeries
+import renderBackends
+import seriesCache
+
+@pytest.fixture
+def folders(tmp_path):
+    os.makedirs(str(tmp_path/"backgrounds"))
+    os.makedirs(str(tmp_path/"objects"))
+    rng = np.random.RandomState(0)
+    Image.fromarray(rng.randint(0, 256, (120, 160, 3)).astype(np.uint8)).save(str(tmp_path/"backgrounds"/"bg.png"))
+    obj = rng.randint(0, 256, (20, 16, 4)).astype(np.uint8)
+    obj[:, :, 3] = 255
+    Image.fromarray(obj).save(str(tmp_path/"objects"/"obj.png"))
+    return str(tmp_path)
+
+@pytest.mark.parametrize("backend", renderBackends.BACKENDS)
+def test_hitThenSave(folders, backend):
+    config = finalImageSeries.getConfig(SAFEIMAGES=False, SIZE=(64, 48), MINFRAMES=3, MAXFRAMES=3, MAXOBJ=2,
+                                        TRANSLATIONLENGTH=(5, 10), BACKEND=backend, USEATLAS=False)
+    series = finalImageSeries.ImageSeries(folders+"/backgrounds", folders+"/objects", config=config, cache=seriesCache.SeriesCache())
+    series.getSeries()
+    data = finalImageSeries.getTrajectoryData(series.seriesLength, series.scene)
+    rendered = [frame.copy() for frame in series.getSeriesWithParam(data['frames'], data['objCount'], data['trajectories'])]
+    cached = series.getSeriesWithParam(data['frames'], data['objCount'], data['trajectories'])
+    assert series.getStats().counters['seriesCacheHits'] == 1
+    for frame in range(data['frames']):
+        assert type(cached[frame]) is type(rendered[frame])
+        assert np.array_equal(cached[frame], rendered[frame])
+    cached[0][0, 0] = 0     #the cache is not changed through the output
+    os.makedirs(folders+"/out")
+    series.saveImages(folders+"/out", "hit")
+    assert len(os.listdir(folders+"/out")) == data['frames']
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#Random access dataset over a trajectory file (see SAFETRAJECTORY / safeTrajectory). Only the trajectories are stored,
+#dataset[k] renders scene k (line k of the file) when it is read, so an epoch needs kilobytes instead of the images:
+#   dataset = TrajectoryDataset("trajectories/trajectories.json", "backgrounds", "objects", backend="numpy")
+#   frames = dataset[k]         #(frames, height, width, 4) uint8 array
+#The byte offset of every line is indexed once, a read only seeks to its line. The backgrounds and objects are loaded
+#in every process on the first read, the dataset itself only holds names, the config and the index. So it can be
+#pickled for worker processes (e.g. torch.utils.data.DataLoader with num_workers > 0 and fork or spawn), every worker
+#loads the images once and keeps its own cache of the last rendered scenes (a cached array is returned again, so don't change it).
+#The images have to be the same as when the trajectories were written. With IMAGENOISE the noise is drawn again.
+#With a seriesCache.SeriesCache with a folder (seriesCache) the rendered scenes are kept on disk for all workers and epochs.
+import json
+from collections import OrderedDict
+import numpy as np
+import finalImageSeries
+
+#Byte offset of every non empty line
+def indexLines(file):
+    offsets = []
+    offset = 0
+    with open(file, 'rb') as f:
+        for line in f:
+            if(len(line.strip()) > 0):
+                offsets.append(offset)
+            offset += len(line)
+    return np.array(offsets, dtype=np.int64)
+
+class TrajectoryDataset():
+    def __init__(self, file, background=None, objects=None, backend=None, config=None, cacheSize=8, seriesCache=None):
+        config = finalImageSeries.getConfig() if config is None else config
+        #the series are returned, never saved
+        self.config = finalImageSeries.getConfig(config, SAFEIMAGES=False, SAFETRAJECTORY=False, SAVESEGMENTATIONMASK=False, SAVEOPTICALFLOW=False)
+        self.file = file
+        self.background = background
+        self.objects = objects
+        self.backend = backend  #name of the backend, the backend itself is created in every process
+        self.cacheSize = cacheSize
+        self.seriesCache = seriesCache
+        self.offsets = indexLines(file)
+        self.series = None
+        self.cache = OrderedDict()
+
+    def __getstate__(self):     #the loaded images and the cache stay in the process
+        state = dict(self.__dict__)
+        state['series'] = None
+        state['cache'] = OrderedDict()
+        return state
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def getTrajectory(self, k):     #the scene as written by safeTrajectory
+        if(k < 0):
+            k += len(self)
+        if(not 0 <= k < len(self)):
+            raise IndexError("trajectory index out of range")
+        with open(self.file, 'rb') as f:
+            f.seek(int(self.offsets[k]))
+            return json.loads(f.readline().decode('utf-8'))
+
+    def getSeries(self):    #ImageSeries of this process
+        if(self.series is None):
+            import renderBackends
+            backend = None if self.backend is None else renderBackends.getBackend(self.backend)
+            self.series = finalImageSeries.ImageSeries(self.background, self.objects, None, 0, backend, self.config, cache=self.seriesCache)
+        return self.series
+
+    def __getitem__(self, k):
+        k = k+len(self) if k < 0 else k
+        if(k in self.cache):
+            self.cache.move_to_end(k)
+            return self.cache[k]
+        data = self.getTrajectory(k)
+        series = self.getSeries()
+        series.setSeriesLength(data['frames'])
+        offset = data['trajectories'][-1].get('offset', 0) if data['objCount'] > 0 else 0     #all objects have the same offset
+        frames = np.stack(series.getSeriesWithParam(data['frames'], data['objCount'], data['trajectories'], offset))
+        if(self.cacheSize > 0):
+            self.cache[k] = frames
+            if(len(self.cache) > self.cacheSize):
+                self.cache.popitem(last=False)
+        return frames